@@ -2,9 +2,12 @@
 
 # pylint: disable=W0601,W0603,W0611,C0301
 
+import hmac
+import time
 import logging
 import connexion
 
+from flask import jsonify, request, g
 from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
@@ -12,10 +15,11 @@ from flask_mail import Mail
 from flask_sqlalchemy import SQLAlchemy
 
 from celery import Celery
+from celery.signals import worker_process_init
 
 from raven.contrib.flask import Sentry
 
-from . import encoder, db
+from . import encoder, db, mappings, migrations, metrics, pool, logs
 
 jwt = JWTManager()
 bcrypt = Bcrypt()
@@ -32,6 +36,8 @@ def main():
     global celery
     global sqldb
 
+    logs.configure()
+
     app = connexion.App(
         __name__,
         specification_dir='/usr/src/app/swagger_server/swagger',
@@ -44,6 +50,10 @@ def main():
 
     app.app.json_encoder = encoder.JSONEncoder
 
+    # Pool settings depend on whether this
+    # is a web or a celery worker process
+    app.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool.engine_options()
+
     # JWT, BCrypt and Mail
     jwt.init_app(app.app)
     bcrypt.init_app(app=app.app)
@@ -76,8 +86,18 @@ def main():
                     db.Session.remove()
 
     celery.conf.update(app.app.config)
+    # Keep the logging set up by logs.configure
+    celery.conf.worker_hijack_root_logger = False
     celery.Task = ContextTask
 
+    # Workers don't serve /metrics, log their counters
+    # (including their connection pools) instead
+    @worker_process_init.connect(weak=False)
+    def _start_metrics_reporter(**_kwargs):
+        interval = app.app.config.get('METRICS_LOG_INTERVAL')
+        if interval:
+            metrics.start_reporter(interval)
+
     @app.app.before_first_request
     def _init_sqlalchemy():
         db.init_db(sqldb.engine)
@@ -90,13 +110,44 @@ def main():
         # the first time it is called
         db.init_db(sqldb.engine)
         db.Session()
+        g.request_start = time.monotonic()
 
     @app.app.after_request
     def _remove_session(res):
         db.Session.remove()
+
+        logs.log_request(
+            request.method,
+            request.path,
+            res.status_code,
+            (time.monotonic() - g.get('request_start', time.monotonic())) * 1000
+        )
+
         return res
 
     app.add_api('swagger.yaml', arguments={'title': 'PDF Service'})
 
-    logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
-    #logging.getLogger().setLevel(logging.INFO)
+    @app.app.cli.command('migrate-db')
+    def _migrate_db():
+        ''' Create missing tables and apply the schema migrations '''
+        engine = pool.maintenance_engine()
+        try:
+            mappings.init(engine)
+            migrations.run(engine)
+        finally:
+            engine.dispose()
+
+    @app.app.route('/metrics')
+    def _metrics():
+        # Counters describe the deployment's internals,
+        # only serve them to the monitoring system
+        token = app.app.config.get('METRICS_TOKEN')
+        if not token:
+            return jsonify(msg='Not Found'), 404
+
+        expected = 'Bearer {}'.format(token)
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return jsonify(msg='Not Authorized'), 401
+
+        return jsonify(metrics.snapshot())
+
@@ -7,7 +7,54 @@ MAX_FILE_SIZE = 50 * 1024 * 1024
 
 PDF_SERVICE_URL = 'http://pdfservice:80'
 FIELD_PARSER_URL = 'http://field-locator:80'
+AUDIT_GEN_URL = 'http://audit-gen'
+# Either 'http', which stamps using the services above,
+# or 'local' which stamps within the celery worker
+STAMP_ENGINE = os.environ.get("STAMP_ENGINE", default='http')
+# Resolution pages are pre-rendered at, this is
+# also the highest resolution served on demand
+RENDER_DPI = 300
+# Number of GhostScript processes used to render a document.
+# Every concurrent celery task starts this many, so only raise
+# it when the worker concurrency leaves cores idle.
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", default=1))
+# Widest page image that may be requested, in pixels
+RENDER_MAX_WIDTH = 2550
+# Render every page after each stamp, when disabled
+# pages are only rendered when they are requested
+PRERENDER_PAGES = os.environ.get("PRERENDER_PAGES", default='1') == '1'
+# Number of pages each web process renders on demand at
+# once and the number of seconds a request waits for one
+# of those renders to finish before it gets a 503
+RENDER_MAX_CONCURRENT = int(os.environ.get("RENDER_MAX_CONCURRENT", default=2))
+RENDER_QUEUE_TIMEOUT = 10
+# Size of the in-memory cache of on-demand rendered pages
+PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Stamps scheduled for the same document within this
+# many seconds of each other are coalesced into one
+STAMP_DEBOUNCE_SECONDS = int(os.environ.get("STAMP_DEBOUNCE_SECONDS", default=5))
+# One of 'google', 'local' (stored under LOCALSTORAGE_KEY)
+# or 'memory' (per process, for tests and benchmarks)
+STORAGE_DRIVER = os.environ.get("STORAGE_DRIVER", default='google')
 LOCALSTORAGE_KEY = '/var/pdfservice/storage'
+# Size of the chunks blobs are streamed in
+STORAGE_READ_CHUNK_SIZE = 1024 * 1024
+# Maximum number of concurrent storage requests per task
+STORAGE_CONCURRENCY = int(os.environ.get("STORAGE_CONCURRENCY", default=8))
+# Either 'proxy', where the backend streams blobs to
+# clients, or 'redirect' where clients are redirected
+# to a signed download URL (google storage only)
+STORAGE_SERVE_MODE = os.environ.get("STORAGE_SERVE_MODE", default='proxy')
+# Lifetime in seconds of signed download URLs
+STORAGE_URL_EXPIRY = 60
+# Lifetime in seconds of the signed page image URLs
+# listed by the page manifest, see pages_get
+PAGE_URL_EXPIRY = 3600
+# Cache-Control of page images addressed by their file
+# id, which never change, and of page images addressed
+# by page number, which change when a page is re-rendered
+PAGE_CACHE_CONTROL_IMMUTABLE = 'private, max-age=31536000, immutable'
+PAGE_CACHE_CONTROL = 'private, no-cache'
 GCP_AUTH_KEY_FILE = '/var/pdfservice/auth.json'
 STORAGE_CONTAINER = 'pdf-esigner-file-storage'
 PROPAGATE_EXCEPTIONS = True
@@ -47,11 +94,84 @@ FIELD_USAGE_TYPE = bidict({
     'agree-tos': 3,
 })
 
+# Number of processed signature images kept in memory by
+# the local stamping engine
+IMAGE_CACHE_SIZE = 256
+
+# Number of PDFs whose field extraction results are cached,
+# the seconds between evictions of the entries past that
+# and the seconds between updates of an entry's last use
+FIELD_CACHE_MAX_ENTRIES = 10000
+FIELD_CACHE_EVICT_INTERVAL = 600
+FIELD_CACHE_TOUCH_INTERVAL = 3600
+
+# Seconds a granted document permission is cached for
+# by each process, see verify_permission, and the
+# number of (user, document) pairs that are cached
+PERMISSION_CACHE_TTL = int(os.environ.get("PERMISSION_CACHE_TTL", default=30))
+PERMISSION_CACHE_MAX_ENTRIES = 10000
+
+# Bearer token required by the /metrics endpoint, which
+# is disabled when this isn't set. See metrics.py.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", default=None)
+# Seconds between the metrics logged by each celery
+# worker process, 0 disables them
+METRICS_LOG_INTERVAL = int(os.environ.get("METRICS_LOG_INTERVAL", default=60))
+
+# Logging, see logs.py. LOG_FORMAT is either 'json'
+# or 'text'. SQL statements are logged at INFO and
+# requests are logged at INFO, the sample rates are
+# the fraction of those records that are kept.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", default='INFO')
+LOG_FORMAT = os.environ.get("LOG_FORMAT", default='json')
+SQL_LOG_LEVEL = os.environ.get("SQL_LOG_LEVEL", default='WARNING')
+SQL_LOG_SAMPLE_RATE = float(os.environ.get("SQL_LOG_SAMPLE_RATE", default=1.0))
+REQUEST_LOG_LEVEL = os.environ.get("REQUEST_LOG_LEVEL", default='INFO')
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", default=0.1))
+
 SQLALCHEMY_ECHO = False
 SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URI", default=None)
+# Used by maintenance work such as migrations, which runs
+# without a statement timeout and takes session-level
+# locks. It must connect to PostgreSQL directly rather
+# than through pgbouncer.
+MAINTENANCE_DATABASE_URI = os.environ.get(
+    "MAINTENANCE_DATABASE_URI", default=SQLALCHEMY_DATABASE_URI
+)
 # Suppress warning since we don't use modification tracking
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Either 'web' or 'worker' (celery), selects the
+# connection pool settings in DB_POOL
+PROCESS_TYPE = os.environ.get("PROCESS_TYPE", default='web')
+# 'queue' keeps a pool of connections in every process,
+# 'pgbouncer' opens a connection for every checkout and
+# leaves pooling to pgbouncer (in transaction mode)
+DB_POOL_MODE = os.environ.get("DB_POOL_MODE", default='queue')
+# Pool settings per process type, every value can be
+# overridden with the environment, e.g. DB_POOL_SIZE.
+# Timeouts are in seconds, statement_timeout is in
+# milliseconds (0 disables it) and isn't applied in
+# pgbouncer mode, set it on the database role instead.
+# It doesn't apply to maintenance work, see
+# pool.maintenance_engine.
+DB_POOL = {
+    'web': {
+        'pool_size': 10,
+        'max_overflow': 10,
+        'pool_timeout': 10,
+        'pool_recycle': 1800,
+        'statement_timeout': 30000,
+    },
+    'worker': {
+        'pool_size': 2,
+        'max_overflow': 2,
+        'pool_timeout': 30,
+        'pool_recycle': 1800,
+        'statement_timeout': 300000,
+    },
+}
+
 MAIL_DEFAULT_SENDER = 'noreply@example.com'
 REMINDER_TARGET_URL = 'http://localhost:3000/view'
 
@@ -1,4 +1,5 @@
 import uuid
+import logging
 from uuid import UUID
 
 from flask import jsonify
@@ -8,10 +9,11 @@ from flask_jwt_extended import (
 from validate_email import validate_email
 
 from .. import config
-from ..db import Session
+from ..db import Session, field_state
 from ..mappings import *
 from ..models import ErrorMessage, DocumentID, SignatureID
 from ..app import bcrypt
+from ..helpers import invalidate_user_permission
 
 @jwt_required
 def account_fields_get():
@@ -36,34 +38,28 @@ def account_fields_get():
     if not user:
         return ErrorMessage('User does not exist'), 400
 
+    state = field_state(session, Field.user_id == uid.bytes)
+
     signatures = (
         session
-            .query(FieldUsage)
-            .join(Field)
-            .join(Document)
+            .query(Field)
+            .join(state, state.c.field_id == Field.id)
+            .join(Document, Document.id == Field.document_id)
             .filter(Field.user_id == uid.bytes)
-            .order_by(FieldUsage.timestamp.desc())
+            .order_by(state.c.timestamp.desc())
             .with_entities(
                 Field.id,
-                FieldUsage.fieldusage_type,
+                state.c.status,
                 Document.title,
-                FieldUsage.timestamp
+                state.c.timestamp
             )
             .all()
     )
 
-    idmap = set()
-
     output = []
     for sig, status, title, timestamp in signatures:
-        sig = UUID(bytes=sig).hex
-
-        if sig in idmap:
-            continue
-        idmap.add(sig)
-
         output.append(SignatureID(
-            id=sig,
+            id=UUID(bytes=sig).hex,
             status=config.FIELD_USAGE_TYPE.inv[status],
             title=title,
             timestamp=timestamp.isoformat()
@@ -113,7 +109,7 @@ def account_change_password_post(newPassword: str):
         return None, 204
 
     except Exception as e:
-        print(str(e))
+        logging.error('Failed to change password: %s', str(e))
         raise
 
 def account_create_post(username: str, password: str, business: int):
@@ -219,6 +215,8 @@ def account_delete_post():
 
     session.commit()
 
+    invalidate_user_permission(uid)
+
     return None, 202
 
 @jwt_required
@@ -8,6 +8,7 @@ import dateutil.parser
 from flask import request, Response
 from flask_jwt_extended import jwt_required
 
+from ... import config
 from ...db import Session
 from ...mappings import *
 from ...models import ErrorMessage
@@ -27,7 +28,7 @@ def get_audit_log_pdf(session, doc_id: UUID):
     ''' Fetch the audit log as a PDF'''
 
     log = fetch_audit(session, doc_id)
-    r = requests.post('http://audit-gen/', json=[x.to_dict() for x in log])
+    r = requests.post(config.AUDIT_GEN_URL + '/', json=[x.to_dict() for x in log])
 
     if r.status_code != 200:
         return Response(
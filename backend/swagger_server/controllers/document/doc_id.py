@@ -1,7 +1,8 @@
+import json
+
 from uuid import UUID
-import requests
 
-from flask import Response, stream_with_context, jsonify
+from flask import Response, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from ... import storage, config, tasks
@@ -10,7 +11,10 @@ from ...mappings import *
 from ...ipinfo import *
 from ...models import ErrorMessage
 from ...decorators import produces
-from ...helpers import verify_permission, add_doc_audit_entry, type_check
+from ...helpers import (
+    verify_permission, invalidate_permission, add_doc_audit_entry,
+    render_page_png, RenderBusyError, blob_response, not_modified, type_check
+)
 
 @jwt_required
 def delete(docId: str):
@@ -46,25 +50,31 @@ def delete(docId: str):
     if not verify_permission(session, doc_id, False):
         return ErrorMessage(msg="Not Authorized"), 401
 
-    files = (
-        session
-            .query(FileUsage)
-            .filter_by(document_id=doc_id.bytes)
-            .with_entities(FileUsage.file_id)
-    ).union_all(
-        session
-            .query(RenderedPage)
-            .filter(RenderedPage.document_id == doc_id.bytes)
-            .with_entities(RenderedPage.file_id)
-    )
-
-    names = map(
-        lambda x: x[0],
-        files
-            .join(File)
+    # Collected up front since the file usages
+    # are deleted before the files themselves
+    file_ids = [
+        x[0] for x in (
+            session
+                .query(FileUsage)
+                .filter(FileUsage.document_id == doc_id.bytes)
+                .filter(FileUsage.file_id.isnot(None))
+                .with_entities(FileUsage.file_id)
+        ).union(
+            session
+                .query(RenderedPage)
+                .filter(RenderedPage.document_id == doc_id.bytes)
+                .with_entities(RenderedPage.file_id)
+        ).all()
+    ]
+
+    names = [
+        x[0] for x in session
+            .query(File)
+            .filter(File.id.in_(file_ids))
             .with_entities(File.filename)
-            .all()
-    )
+            .distinct()
+    ]
+
     fields = (
         session
             .query(FieldUsage)
@@ -83,7 +93,7 @@ def delete(docId: str):
     (
         session
             .query(File)
-            .filter(File.id.in_(files.subquery()))
+            .filter(File.id.in_(file_ids))
             .delete(synchronize_session=False)
     )
 
@@ -110,10 +120,29 @@ def delete(docId: str):
 
     session.commit()
 
-    tasks.delete_blobs.delay([x for x in names])
+    invalidate_permission(doc_id)
+
+    tasks.delete_blobs.delay(names)
 
     return None, 204
 
+@type_check
+def get_latest_filename(session, doc_id: UUID):
+    ''' Get the blob name of the newest revision of the document '''
+
+    filename = (
+        session
+            .query(FileUsage)
+            .join(File)
+            .filter(FileUsage.document_id == doc_id.bytes)
+            .filter(FileUsage.file_id.isnot(None))
+            .order_by(FileUsage.timestamp.desc())
+            .with_entities(File.filename)
+            .first()
+    )
+
+    return filename[0] if filename else None
+
 @type_check
 def get_as_pdf(session, doc_id: UUID):
     ''' Fetch the document as a PDF '''
@@ -141,33 +170,61 @@ def get_as_pdf(session, doc_id: UUID):
 
     session.commit()
 
-    filename = (
-        session
-            .query(FileUsage)
-            .join(File)
-            .filter(FileUsage.document_id == doc_id.bytes)
-            .filter(FileUsage.file_id.isnot(None))
-            .order_by(FileUsage.timestamp.desc())
-            .with_entities(File.filename)
-            .first()
-    )
+    filename = get_latest_filename(session, doc_id)
 
     if not filename:
         return ErrorMessage("Not Found"), 404
-    filename = filename[0]
 
-    blob = container.get_blob(filename)
-    url = blob.generate_download_url(expires=60)
-    r = requests.get(url, stream=True)
+    return blob_response(container.get_blob(filename))
+@type_check
+def get_rendered_png(session, doc_id: UUID, page: int, dpi=None, width=None):
+    ''' Render the page of a document at the given
+        resolution, see helpers.render_page_png
+    '''
+
+    container = storage.container()
+    filename = get_latest_filename(session, doc_id)
+
+    if not filename:
+        return ErrorMessage(msg="Not Found"), 404
+
+    # The rendered image only depends on the revision
+    # and the requested page and resolution
+    etag = '{}-{}-{}-{}'.format(filename, page, dpi, width)
+    cached = not_modified(etag, config.PAGE_CACHE_CONTROL)
+    if cached:
+        return cached
+
+    try:
+        data = render_page_png(container, filename, page, dpi=dpi, width=width)
+    except RenderBusyError:
+        return Response(
+            json.dumps({'msg': "Too many pages are being rendered"}),
+            mimetype='application/json',
+            headers={'Retry-After': 5}
+        ), 503
+
+    if data is None:
+        return ErrorMessage(msg="Not Found"), 404
+
+    response = Response(data, mimetype='image/png', status=200)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = config.PAGE_CACHE_CONTROL
+
+    return response
 
-    return Response(
-        stream_with_context(r.iter_content(chunk_size=1024)),
-        mimetype=r.headers['Content-Type'],
-        status=200
-    )
 @type_check
-def get_as_png(session, doc_id: UUID, page: int):
-    ''' Fetch the page of a document as a PNG image '''
+def get_as_png(session, doc_id: UUID, page: int, dpi=None, width=None):
+    ''' Fetch the page of a document as a PNG image. Pages
+        requested at a specific resolution are rendered on
+        demand, otherwise the pre-rendered page is served
+        if it exists. Responses carry an ETag so clients can
+        revalidate their copy with a conditional GET.
+    '''
+
+    if dpi is not None or width is not None:
+        return get_rendered_png(session, doc_id, page, dpi=dpi, width=width)
+
     container = storage.container()
 
     filename = (
@@ -183,18 +240,20 @@ def get_as_png(session, doc_id: UUID, page: int):
     )
 
     if not filename:
-        return ErrorMessage(msg="Not Found"), 404
+        # The page hasn't been pre-rendered, render it now
+        return get_rendered_png(session, doc_id, page)
 
+    # Rendered page blobs are never overwritten
+    # so the blob name identifies the image
     filename = filename[0]
-
-    blob = container.get_blob(filename)
-    url = blob.generate_download_url(expires=60)
-    r = requests.get(url, stream=True)
-
-    return Response(
-        stream_with_context(r.iter_content(chunk_size=1024)),
-        mimetype=r.headers['Content-Type'],
-        status=200
+    cached = not_modified(filename, config.PAGE_CACHE_CONTROL)
+    if cached:
+        return cached
+
+    return blob_response(
+        container.get_blob(filename),
+        etag=filename,
+        cache_control=config.PAGE_CACHE_CONTROL
     )
 
 def query_best():
@@ -210,7 +269,7 @@ def query_best():
 @jwt_required
 @fetch_ip
 @produces('application/pdf', 'image/png')
-def get(docId: str, page: int = None):
+def get(docId: str, page: int = None, dpi: int = None, width: int = None):
     """ Fetch a document or page of a document.
         This endpoint will record that the document
         has been viewed in the audit log. The
@@ -228,6 +287,13 @@ def get(docId: str, page: int = None):
             page (int):
                 The page to be fetched, ignored if the client
                 is not requesting an image.
+            dpi (int):
+                The resolution to render the page at, ignored
+                if the client is not requesting an image.
+            width (int):
+                The width in pixels to render the page at,
+                ignored if dpi is given or the client is not
+                requesting an image.
 
         Response:
             If successful, this endpoint will respond
@@ -261,7 +327,7 @@ def get(docId: str, page: int = None):
     if accept == 'application/pdf':
         return get_as_pdf(session, doc_id)
     elif accept == 'image/png':
-        return get_as_png(session, doc_id, int(page))
+        return get_as_png(session, doc_id, int(page), dpi=dpi, width=width)
     else:
         return jsonify(
             title='Not Acceptable',
@@ -5,9 +5,9 @@ from flask import Response, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from ...decorators import produces
-from ...db import Session
+from ...db import Session, field_state
 from ...models import ErrorMessage
-from ...mappings import Document, Field, FileUsage, FieldUsage
+from ...mappings import Document, Field, FileUsage
 from ... import config
 from ...helpers import verify_permission, type_check
 
@@ -15,18 +15,14 @@ from ...helpers import verify_permission, type_check
 def get_filled(session, doc_id: UUID):
     ''' Get all fields that have been filled '''
 
-    subquery = (
-        session
-            .query(FieldUsage)
-            .filter(FieldUsage.field_id == Field.id)
-            .filter(FieldUsage.fieldusage_type == config.FIELD_USAGE_TYPE["filled"])
-    )
+    state = field_state(session, Field.document_id == doc_id.bytes)
 
     return (
         session
             .query(Field)
+            .join(state, state.c.field_id == Field.id)
             .filter(Field.document_id == doc_id.bytes)
-            .filter(subquery.exists())
+            .filter(state.c.filled_usage_id != None)
             .with_entities(Field.id)
             .all()
     )
@@ -122,8 +118,6 @@ def info_get(docId: str):
 
     filled = set(UUID(bytes=x[0]) for x in get_filled(session, doc_id))
 
-    print(filled)
-
     filtered = []
     for field in field_data['fields']:
         if field['name'] in fields_for_user:
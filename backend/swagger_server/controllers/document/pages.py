@@ -0,0 +1,191 @@
+import time
+import hashlib
+
+from uuid import UUID
+
+from flask import request, jsonify
+from flask_jwt_extended import jwt_required
+
+from ... import storage, config
+from ...db import Session
+from ...models import ErrorMessage
+from ...mappings import File, RenderedPage
+from ...decorators import produces
+from ...helpers import (
+    verify_permission, get_field_layout_revision, blob_response, not_modified,
+    redirects_to_storage, type_check
+)
+
+@type_check
+def get_rendered_pages(session, doc_id: UUID) -> list:
+    ''' Get the newest rendered image of every page
+        of the document, as (page, file_id, filename)
+        tuples ordered by page.
+    '''
+
+    return (
+        session
+            .query(RenderedPage)
+            .join(File)
+            .filter(RenderedPage.document_id == doc_id.bytes)
+            .order_by(RenderedPage.page, RenderedPage.id.desc())
+            .distinct(RenderedPage.page)
+            .with_entities(RenderedPage.page, RenderedPage.file_id, File.filename)
+            .all()
+    )
+
+def page_url(file_id: UUID) -> str:
+    ''' The URL of a page image served through the
+        backend, relative to the manifest's URL
+    '''
+
+    return '{}{}/{}'.format(
+        request.script_root,
+        request.path.rstrip('/'),
+        file_id.hex
+    )
+
+@jwt_required
+@produces('application/json')
+def pages_get(docId: str):
+    ''' List the image of every page of the document
+        so that a viewer can fetch them all with a
+        single permission check.
+
+        Arguments:
+            docId (str): The document ID
+
+        Response:
+            If successful, this endpoint will respond
+            with HTTP 200 and JSON listing the URL of
+            each page image. Images are addressed by
+            their file ID and never change, so they can
+            be cached indefinitely. Pages that haven't
+            been rendered yet have no URL and should be
+            fetched from the document endpoint instead.
+
+            When pages are served from storage the URLs
+            are signed and expire after the number of
+            seconds given by 'expires'.
+
+            If an error occurrs this endpoint will
+            respond with a 4XX error code and a
+            JSON body describing the error.
+    '''
+
+    try:
+        doc_id = UUID(hex=docId)
+    except ValueError:
+        return ErrorMessage("Not a valid document ID"), 400
+
+    session = Session()
+
+    if not verify_permission(session, doc_id):
+        return ErrorMessage("Not Authorized"), 401
+
+    rendered = get_rendered_pages(session, doc_id)
+    (revision, layout) = get_field_layout_revision(session, doc_id)
+    num_pages = len(layout['pages']) if layout else 0
+
+    # The manifest only changes when pages are rendered
+    # or the fields are located (again)
+    etag = hashlib.sha256(
+        '{}:{}:'.format(revision, num_pages).encode() +
+        b''.join(x[1] for x in rendered)
+    ).hexdigest()
+    if not redirects_to_storage():
+        cached = not_modified(etag, config.PAGE_CACHE_CONTROL)
+        if cached:
+            return cached
+
+    pages = dict(
+        (x, {'page': x, 'url': None})
+        for x in range(1, num_pages + 1)
+    )
+
+    if redirects_to_storage():
+        # Signed without fetching the blobs, see download_url
+        container = storage.container()
+        urls = [
+            storage.download_url(container, x[2], config.PAGE_URL_EXPIRY)
+            for x in rendered
+        ]
+        expires = int(time.time()) + config.PAGE_URL_EXPIRY
+    else:
+        urls = [page_url(UUID(bytes=x[1])) for x in rendered]
+        expires = None
+
+    for ((page, file_id, _), url) in zip(rendered, urls):
+        pages[page] = {
+            'page': page,
+            'url': url,
+            'id': UUID(bytes=file_id).hex
+        }
+
+    response = jsonify(
+        pages=[pages[x] for x in sorted(pages)],
+        expires=expires
+    )
+
+    # Signed URLs expire so the manifest can't be revalidated
+    if not redirects_to_storage():
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = config.PAGE_CACHE_CONTROL
+
+    return response, 200
+
+@jwt_required
+@produces('image/png')
+def page_get(docId: str, fileId: str):
+    ''' Fetch a rendered page image, as listed by
+        pages_get. The image for a file ID never
+        changes so it may be cached indefinitely.
+
+        Arguments:
+            docId (str): The document ID
+            fileId (str): The file ID of the page image
+
+        Response:
+            If successful, this endpoint will respond
+            with HTTP 200 and the PNG image, or HTTP 304
+            if the client already has it.
+
+            If an error occurrs this endpoint will
+            respond with a 4XX error code and a
+            JSON body describing the error.
+    '''
+
+    try:
+        doc_id = UUID(hex=docId)
+        file_id = UUID(hex=fileId)
+    except ValueError:
+        return ErrorMessage("Not a valid ID"), 400
+
+    session = Session()
+
+    if not verify_permission(session, doc_id):
+        return ErrorMessage("Not Authorized"), 401
+
+    cached = not_modified(file_id.hex, config.PAGE_CACHE_CONTROL_IMMUTABLE)
+    if cached:
+        return cached
+
+    filename = (
+        session
+            .query(RenderedPage)
+            .join(File)
+            .filter(RenderedPage.document_id == doc_id.bytes)
+            .filter(RenderedPage.file_id == file_id.bytes)
+            .with_entities(File.filename)
+            .first()
+    )
+
+    if not filename:
+        return ErrorMessage("Not Found"), 404
+
+    return blob_response(
+        storage.container().get_blob(filename[0]),
+        mimetype='image/png',
+        etag=file_id.hex,
+        cache_control=config.PAGE_CACHE_CONTROL_IMMUTABLE
+    )
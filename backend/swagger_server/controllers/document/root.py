@@ -14,7 +14,9 @@ from ...db import Session
 from ...mappings import *
 from ...ipinfo import *
 from ...models import ErrorMessage
-from ...helpers import type_check
+from ...helpers import upload_file, hash_stream, type_check
+from ...helpers import invalidate_permission
+from ...helpers import get_cached_fields, put_cached_fields
 
 # Document field referencing spec(ish):
 # Fields that are meant to reference
@@ -137,11 +139,17 @@ def create_user(session, user: str, business: int):
     return (new_uid.bytes,)
 
 @type_check
-def get_document_fields(pdfdata) -> dict:
+def get_document_fields(session, pdfdata, digest: str) -> dict:
     ''' Query the field extractor service to get
-        the fields within the provided service
+        the fields within the provided service. Results
+        are cached by the content hash of the PDF so
+        known templates are only parsed once.
     '''
 
+    fields = get_cached_fields(session, digest, 'fields')
+    if fields is not None:
+        return fields
+
     resp = requests.post(
         config.PDF_SERVICE_URL + '/fields',
         pdfdata,
@@ -154,7 +162,10 @@ def get_document_fields(pdfdata) -> dict:
             'details': resp.content
         }, 400)
 
-    return {k.strip(): v.strip() for k, v in json.loads(resp.content).items()}
+    fields = {k.strip(): v.strip() for k, v in json.loads(resp.content).items()}
+    put_cached_fields(session, digest, 'fields', fields)
+
+    return fields
 
 def strip_if_not_none(s: str) -> str:
     ''' Utility method to strip if not None '''
@@ -338,13 +349,14 @@ def create_field(
     session.add(field)
     session.add(fieldusage)
 
+    invalidate_permission(doc_id)
+
     return field_id
 
 @type_check
-def create_document(session, user_id: UUID, title: str):
-    ''' Create a new document '''
+def create_document(session, user_id: UUID, title: str, file_id: UUID) -> UUID:
+    ''' Create a new document for an uploaded file '''
 
-    file_id = uuid.uuid4()
     doc_id = uuid.uuid4()
 
     username = (
@@ -355,9 +367,6 @@ def create_document(session, user_id: UUID, title: str):
             .one()
     )[0]
 
-    file_db = File(
-        id=file_id.bytes,
-        filename=file_id.hex)
     doc_db = Document(
         id=doc_id.bytes,
         title=title,
@@ -373,7 +382,6 @@ def create_document(session, user_id: UUID, title: str):
         })
     )
 
-    session.add(file_db)
     session.add(doc_db)
     session.add(fileusage_db)
 
@@ -381,7 +389,7 @@ def create_document(session, user_id: UUID, title: str):
     assert fileusage_db.id is not None
     tasks.invoke_webhooks_fileusage.delay(fileusage_db.id)
 
-    return (doc_id, file_id)
+    return doc_id
 
 @jwt_required
 @fetch_ip
@@ -431,14 +439,17 @@ def document_post(docName: str, signators: str, file):
                 '{} is not a valid email address'.format(email)
             ), 400
 
-    fields = get_document_fields(file)
+    session = Session()
+    container = storage.container()
+
+    digest = hash_stream(file.stream)
+
+    fields = get_document_fields(session, file, digest)
     refs = get_reference_fields(fields)
 
     validate_user_filled_fields(fields, signatures)
     validate_reference_fields(fields, refs)
 
-    session = Session()
-    container = storage.container()
     user_id = uuid.UUID(hex=get_jwt_identity())
 
     business = (
@@ -450,14 +461,16 @@ def document_post(docName: str, signators: str, file):
             .one()
     )[0]
 
-    doc_id, file_id = create_document(session, user_id, docName)
-
     file.stream.seek(0)
 
-    container.upload_blob(
-        filename=file.stream,
-        content_type='application/pdf',
-        blob_name=file_id.hex)
+    file_id = upload_file(
+        session,
+        container,
+        file.stream,
+        'application/pdf',
+        digest
+    )
+    doc_id = create_document(session, user_id, docName, file_id)
 
     field_ids = {}
 
@@ -503,7 +516,7 @@ def document_post(docName: str, signators: str, file):
     # Launch celery task to add a FileUsage entry
     # containing the fields for the new document
     tasks.get_field_info.delay(doc_id.hex)
-    tasks.stamp_pdf.delay(doc_id.hex)
+    tasks.schedule_stamp(session, doc_id)
 
     # TODO: Change raw JSON into an object binding
     return jsonify(docId=doc_id.hex, warnings=warnings), 200
@@ -1,5 +1,5 @@
 import json
-import uuid
+import logging
 
 from uuid import UUID
 from datetime import datetime
@@ -8,11 +8,11 @@ from flask import request, Response, abort, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from .. import storage, config
-from ..db import Session
+from ..db import Session, field_state
 from ..mappings import *
 from ..ipinfo import *
-from ..tasks import stamp_pdf, invoke_webhooks_fieldusage, invoke_webhooks_fileusage
-from ..helpers import type_check
+from ..tasks import schedule_stamp, invoke_webhooks_fieldusage, invoke_webhooks_fileusage
+from ..helpers import upload_signature, type_check
 
 @type_check
 def error_abort(fields: dict, status: int):
@@ -41,14 +41,7 @@ def parse_field_id(fieldId: str) -> UUID:
         error_abort(dict(msg='Not a valid Field ID'), 400)
 
 @type_check
-def create_fill_field_entry(session, field_id: UUID) -> UUID:
-    file_id = uuid.uuid4()
-
-    file = File(
-        id=file_id.bytes,
-        filename=file_id.hex,
-        request_uri=None
-    )
+def create_fill_field_entry(session, field_id: UUID, file_id: UUID):
     usage = FieldUsage(
         field_id=field_id.bytes,
         fieldusage_type=config.FIELD_USAGE_TYPE['filled'],
@@ -56,14 +49,11 @@ def create_fill_field_entry(session, field_id: UUID) -> UUID:
         data=json.dumps({'ip': get_ip()})
     )
 
-    session.add(file)
     session.add(usage)
 
     session.flush()
     assert usage.id is not None
     invoke_webhooks_fieldusage.delay(usage.id)
-
-    return file_id
 @type_check
 def create_fill_field_entry_text(session, field_id: UUID, value: str):
     usage = FieldUsage(
@@ -133,21 +123,17 @@ def validate_field_id(session, field_id: UUID, uid: UUID):
 
 @type_check
 def check_all_fields_filled(session, doc_id: UUID):
-    subquery = (
-        session
-            .query(Field)
-            .join(FieldUsage)
-            .join(FieldUsageType)
-            .filter(FieldUsageType.name == 'filled')
-            .filter(Field.document_id == doc_id.bytes)
-            .with_entities(Field.id)
-            .distinct()
-    )
+    # The usages have to be flushed for field_state to
+    # reflect them, see db.py
+    session.flush()
+
+    state = field_state(session, Field.document_id == doc_id.bytes)
 
     unsigned = (
         session
             .query(Field)
-            .filter(~Field.id.in_(subquery))
+            .outerjoin(state, state.c.field_id == Field.id)
+            .filter(state.c.filled_usage_id == None)
             .filter(Field.document_id == doc_id.bytes)
             .filter(Field.user_id != None)
             .with_entities(Field.id)
@@ -196,14 +182,10 @@ def fill_signature(fieldId: str, fieldData):
 
     validate_field_id(session, field_id, uid)
 
-    file_id = create_fill_field_entry(session, field_id)
+    file_id = upload_signature(session, container, signature.stream, signature.content_type)
+    create_fill_field_entry(session, field_id, file_id)
     fill_dependant_fields(session, field_id)
 
-    container.upload_blob(
-        filename=signature.stream,
-        content_type=signature.content_type,
-        blob_name=file_id.hex)
-
     doc_id = (
         session
             .query(Field)
@@ -215,7 +197,7 @@ def fill_signature(fieldId: str, fieldData):
     check_all_fields_filled(session, UUID(bytes=doc_id))
 
     session.commit()
-    stamp_pdf.delay(UUID(bytes=doc_id).hex)
+    schedule_stamp(session, UUID(bytes=doc_id))
 
     return None, 204
 
@@ -259,7 +241,7 @@ def fill_text(fieldId: str, value: str):
 
     session.commit()
 
-    stamp_pdf.delay(UUID(bytes=doc_id).hex)
+    schedule_stamp(session, UUID(bytes=doc_id))
 
     return None, 204
 
@@ -297,14 +279,9 @@ def bulk_fill_impl(**kwargs):
                         f' of ${value.mimetype} instead of image/png'
                 }), 415
 
-            file_id = create_fill_field_entry(session, field_id)
+            file_id = upload_signature(session, container, value.stream, value.mimetype)
+            create_fill_field_entry(session, field_id, file_id)
             fill_dependant_fields(session, field_id)
-
-            container.upload_blob(
-                filename=value.stream,
-                content_type=value.mimetype,
-                blob_name=file_id.hex
-            )
         else:
             create_fill_field_entry_text(session, field_id, value)
             fill_dependant_fields(session, field_id)
@@ -320,12 +297,12 @@ def bulk_fill_impl(**kwargs):
     check_all_fields_filled(session, UUID(bytes=doc_id))
 
     session.commit()
-    stamp_pdf.delay(UUID(bytes=doc_id).hex)
+    schedule_stamp(session, UUID(bytes=doc_id))
 
     return None, 204
 
 def bulk_fill():
-    print(request.files)
+    logging.debug('bulk_fill files: %s', request.files)
 
     form = request.form.to_dict(flat=True)
     form.update(request.files.to_dict(flat=True))
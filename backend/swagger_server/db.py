@@ -3,10 +3,12 @@
 
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy import event, DDL
+from sqlalchemy.sql import select, and_, or_, case, null
+from sqlalchemy.dialects.postgresql import insert
 
 from flask import request
 
-from . import mappings, config
+from . import mappings, migrations, config
 
 def _get_current_request_or_task():
     from .app import celery
@@ -27,9 +29,11 @@ def init_db(engine):
     if _configured:
         return Session
 
-    _configured = True
+    # Only marked as configured once this succeeded,
+    # otherwise the next request or task retries
     mappings.init(engine)
     Session.session_factory.configure(bind=engine)
+    _configured = True
     return Session
 
 # Add initial config values to the database
@@ -74,3 +78,149 @@ def __decl_events():
     )
 
 __decl_events()
+
+# Maintain the field_state projection of fieldusage
+
+def _field_state_upsert(rows):
+    ''' Upsert the usages selected by rows into field_state,
+        keeping whichever of the current and new usages is
+        the latest. rows selects (field_id, usage_id, status,
+        timestamp, filled_usage_id, file_id, data).
+    '''
+    from .mappings import FieldState
+
+    current = FieldState.__table__.c
+    stmt = insert(FieldState.__table__).from_select(
+        [
+            'field_id', 'usage_id', 'status', 'timestamp',
+            'filled_usage_id', 'file_id', 'data'
+        ],
+        rows
+    )
+    new = stmt.excluded
+
+    newer = new.usage_id > current.usage_id
+    newer_filled = and_(
+        new.filled_usage_id != None,
+        or_(
+            current.filled_usage_id == None,
+            new.filled_usage_id > current.filled_usage_id
+        )
+    )
+
+    def pick(cond, column):
+        return case([(cond, getattr(new, column))], else_=getattr(current, column))
+
+    return stmt.on_conflict_do_update(
+        index_elements=['field_id'],
+        set_={
+            'usage_id': pick(newer, 'usage_id'),
+            'status': pick(newer, 'status'),
+            'timestamp': pick(newer, 'timestamp'),
+            'filled_usage_id': pick(newer_filled, 'filled_usage_id'),
+            'file_id': pick(newer_filled, 'file_id'),
+            'data': pick(newer_filled, 'data'),
+        }
+    )
+
+def __field_state_events():
+    from .mappings import FieldUsage
+
+    usage = FieldUsage.__table__.c
+
+    def if_filled(column):
+        filled = usage.fieldusage_type == config.FIELD_USAGE_TYPE['filled']
+        return case([(filled, column)], else_=null())
+
+    @event.listens_for(FieldUsage, 'after_insert')
+    def _update_field_state(_mapper, connection, target):
+        # Runs within the same transaction as the insert,
+        # the row is selected back to get server defaults
+        connection.execute(_field_state_upsert(
+            select([
+                usage.field_id,
+                usage.id,
+                usage.fieldusage_type,
+                usage.timestamp,
+                if_filled(usage.id),
+                if_filled(usage.file_id),
+                if_filled(usage.data)
+            ]).where(usage.id == target.id)
+        ))
+
+__field_state_events()
+
+def _field_state_rows(*criteria):
+    ''' Select the current state of fields from the fieldusage
+        history, with the columns of field_state. criteria on
+        Field restrict which fields are selected.
+    '''
+    from .mappings import Field, FieldUsage
+
+    usage = FieldUsage.__table__
+    field = Field.__table__
+
+    def latest_per_field(query):
+        if criteria:
+            query = (
+                query
+                    .select_from(usage.join(field, field.c.id == usage.c.field_id))
+                    .where(and_(*criteria))
+            )
+
+        return (
+            query
+                .distinct(usage.c.field_id)
+                .order_by(usage.c.field_id, usage.c.id.desc())
+        )
+
+    latest = latest_per_field(select([usage])).alias('latest')
+    filled = latest_per_field(
+        select([usage])
+            .where(usage.c.fieldusage_type == config.FIELD_USAGE_TYPE['filled'])
+    ).alias('filled')
+
+    return select([
+        latest.c.field_id,
+        latest.c.id.label('usage_id'),
+        latest.c.fieldusage_type.label('status'),
+        latest.c.timestamp,
+        filled.c.id.label('filled_usage_id'),
+        filled.c.file_id,
+        filled.c.data
+    ]).select_from(
+        latest.outerjoin(filled, filled.c.field_id == latest.c.field_id)
+    )
+
+def backfill_field_state(conn):
+    ''' Build field_state from the fieldusage history,
+        for usages inserted before it was maintained.
+        Safe to run while usages are being inserted.
+        This is applied by migration 2.
+    '''
+
+    conn.execute(_field_state_upsert(_field_state_rows()))
+
+# Set once the backfill migration is seen to be applied
+_field_state_ready = False
+
+def field_state(session, *criteria):
+    ''' Get a selectable with the current state of each
+        field, with the columns of the FieldState mapping.
+        This is the field_state table once it has been
+        backfilled (see migrations), until then the state
+        of the fields matching criteria on Field is read
+        from the fieldusage history.
+    '''
+    global _field_state_ready
+    from .mappings import FieldState
+
+    if not _field_state_ready:
+        _field_state_ready = migrations.is_applied(
+            session, migrations.FIELD_STATE_BACKFILL
+        )
+
+    if _field_state_ready:
+        return FieldState.__table__
+
+    return _field_state_rows(*criteria).alias('field_state')
@@ -1,6 +1,14 @@
 
-from ._verify import verify_permission
+from ._verify import verify_permission, invalidate_permission, invalidate_user_permission
 from ._fetch_audit import get_audit_log as fetch_audit
 from ._add_audit_entry import add_doc_audit_entry
 from ._download_blob import download_blob_stream
 from ._type_check import type_check
+from ._field_layout import get_field_layout, get_field_layout_revision
+from ._render_page import render_page_png, RenderBusyError
+from ._blob_response import blob_response, not_modified, redirects_to_storage
+from ._upload_file import upload_file
+from ._upload_file import hash_stream, content_hash, blob_name, lock_blob
+from ._field_cache import get_cached_fields, put_cached_fields
+from ._signature_image import upload_signature, processed_name, processed_names
+from ._parallel import storage_executor, storage_map
@@ -0,0 +1,71 @@
+from flask import Response, request, redirect, send_file
+
+from .. import storage, config
+
+# Storage drivers whose blobs have signed download URLs,
+# blobs of the others (local and memory) are always
+# served through the backend
+_SIGNED_URL_DRIVERS = ('google',)
+
+def redirects_to_storage() -> bool:
+    ''' Whether blobs are served by redirecting clients
+        to signed download URLs, see STORAGE_SERVE_MODE
+    '''
+
+    return config.STORAGE_SERVE_MODE == 'redirect' and \
+        config.STORAGE_DRIVER in _SIGNED_URL_DRIVERS
+
+def not_modified(etag: str, cache_control: str = None):
+    ''' Create a 304 response if the request is a
+        conditional GET for the given entity tag,
+        otherwise return None.
+    '''
+
+    if not request.if_none_match.contains_weak(etag):
+        return None
+
+    response = Response(status=304)
+    response.set_etag(etag)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+
+    return response
+
+def blob_response(blob, mimetype=None, etag=None, cache_control=None):
+    ''' Create a response serving the contents of a blob.
+
+        Depending on STORAGE_SERVE_MODE and the storage
+        driver this redirects the client to a signed
+        download URL, hands a local file to the server
+        (which can use sendfile) or streams the blob
+        through without buffering it.
+
+        The etag and cache_control headers are only set
+        when the contents are served, redirects to signed
+        URLs must not be cached past the URL's expiry.
+    '''
+
+    mimetype = mimetype or blob.content_type
+
+    if redirects_to_storage():
+        return redirect(storage.download_url(
+            blob.container, blob.name, config.STORAGE_URL_EXPIRY
+        ))
+
+    path = storage.local_path(blob)
+    if path is not None:
+        response = send_file(path, mimetype=mimetype, conditional=False)
+    else:
+        response = Response(
+            storage.iter_blob(blob),
+            mimetype=mimetype,
+            status=200,
+            direct_passthrough=True
+        )
+
+    if etag:
+        response.set_etag(etag)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+
+    return response
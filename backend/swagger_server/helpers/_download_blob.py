@@ -1,8 +1,4 @@
-
-import requests
+from .. import storage
 
 def download_blob_stream(blob):
-    url = blob.generate_download_url(expires=60)
-    r = requests.get(url)
-
-    return r.content
+    return storage.read_blob(blob)
@@ -29,6 +29,10 @@ def get_audit_log(session, doc_id: UUID) -> list:
                 vals['status'] = 'stamp_failed'
             else:
                 vals['status'] = 'stamp_success'
+                # Bookkeeping for the render task, not part of the log
+                data.pop('fieldusage', None)
+                data.pop('fields', None)
+                data.pop('rendered', None)
 
         return vals
     def sig_audit_map(x):
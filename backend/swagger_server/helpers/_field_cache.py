@@ -0,0 +1,121 @@
+# pylint: disable=W0603
+
+from datetime import timedelta
+
+import json
+import time
+import threading
+
+from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert
+
+from .. import config
+from ..mappings import FieldCache
+from ._type_check import type_check
+
+# Columns of FieldCache that can be cached
+_KINDS = ('fields', 'layout')
+
+# When this process last evicted entries, see put_cached_fields
+_last_eviction = None
+_eviction_lock = threading.Lock()
+
+def _eviction_due() -> bool:
+    global _last_eviction
+
+    with _eviction_lock:
+        now = time.monotonic()
+        if _last_eviction is not None and \
+                now - _last_eviction < config.FIELD_CACHE_EVICT_INTERVAL:
+            return False
+
+        _last_eviction = now
+        return True
+
+@type_check
+def get_cached_fields(session, digest: str, kind: str):
+    ''' Look up a cached field extraction result for
+        the PDF with the given content hash.
+
+        Arguments:
+            digest (str): SHA-256 hex digest of the PDF.
+            kind (str):
+                Either 'fields', the field values from
+                pdf-service /fields, or 'layout', the field
+                locations from field-locator /locate-fields.
+
+        Returns:
+            The cached value or None if it isn't cached.
+    '''
+
+    assert kind in _KINDS
+
+    # Eviction only needs a rough idea of when an entry
+    # was last used, so hits rarely have to write
+    stale = FieldCache.last_used < \
+        func.now() - timedelta(seconds=config.FIELD_CACHE_TOUCH_INTERVAL)
+
+    row = (
+        session
+            .query(FieldCache)
+            .filter(FieldCache.hash == digest)
+            .with_entities(getattr(FieldCache, kind), stale)
+            .one_or_none()
+    )
+
+    if not row or row[0] is None:
+        return None
+
+    if row[1]:
+        (
+            session
+                .query(FieldCache)
+                .filter(FieldCache.hash == digest)
+                .update({'last_used': func.now()}, synchronize_session=False)
+        )
+
+    value = row[0]
+    if isinstance(value, str):
+        value = json.loads(value)
+
+    return value
+
+@type_check
+def put_cached_fields(session, digest: str, kind: str, value: dict):
+    ''' Cache a field extraction result for the PDF with
+        the given content hash, see get_cached_fields.
+        The least recently used entries are evicted once
+        there are more than FIELD_CACHE_MAX_ENTRIES, this
+        is done at most every FIELD_CACHE_EVICT_INTERVAL
+        seconds by each process.
+    '''
+
+    assert kind in _KINDS
+
+    session.execute(
+        insert(FieldCache.__table__)
+            .values(hash=digest, **{kind: json.dumps(value)})
+            .on_conflict_do_update(
+                index_elements=['hash'],
+                set_={kind: json.dumps(value), 'last_used': func.now()}
+            )
+    )
+
+    if not _eviction_due():
+        return
+
+    evicted = (
+        session
+            .query(FieldCache)
+            .order_by(FieldCache.last_used.desc())
+            .offset(config.FIELD_CACHE_MAX_ENTRIES)
+            .with_entities(FieldCache.hash)
+            .subquery()
+    )
+
+    (
+        session
+            .query(FieldCache)
+            .filter(FieldCache.hash.in_(evicted))
+            .delete(synchronize_session=False)
+    )
@@ -0,0 +1,49 @@
+from uuid import UUID
+
+import json
+
+from .. import config
+from ..mappings import *
+from ._type_check import type_check
+
+@type_check
+def get_field_layout_revision(session, doc_id: UUID) -> tuple:
+    ''' Get the field locations stored by the get_field_info
+        task along with the id of the describe-fields usage
+        they were stored in, which changes whenever they are
+        located again. Returns (None, None) if they haven't
+        been located yet, and (id, None) if the field
+        locator failed.
+    '''
+
+    row = (
+        session
+            .query(FileUsage)
+            .filter(FileUsage.document_id == doc_id.bytes)
+            .filter(FileUsage.fileusage_type == config.FILE_USAGE_TYPES['describe-fields'])
+            .order_by(FileUsage.timestamp.desc())
+            .with_entities(FileUsage.id, FileUsage.data)
+            .first()
+    )
+
+    if not row:
+        return (None, None)
+
+    layout = row[1]
+    if not isinstance(layout, dict):
+        layout = json.loads(layout)
+
+    # An empty entry is stored when the field locator fails
+    if 'fields' not in layout or 'pages' not in layout:
+        return (row[0], None)
+
+    return (row[0], layout)
+
+@type_check
+def get_field_layout(session, doc_id: UUID):
+    ''' Get the field locations stored by the get_field_info
+        task, or None if they haven't been located yet or
+        the field locator failed.
+    '''
+
+    return get_field_layout_revision(session, doc_id)[1]
@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from .. import config
+
+def storage_executor(workers: int = None) -> ThreadPoolExecutor:
+    ''' Create a thread pool for storage requests. Its
+        size is capped at STORAGE_CONCURRENCY so that a
+        single task doesn't open an unbounded number of
+        connections. Requests share the pooled connections
+        of the process-wide storage driver.
+
+        Arguments:
+            workers (int):
+                The number of requests that will be made,
+                fewer threads are started if this is lower
+                than STORAGE_CONCURRENCY.
+    '''
+
+    if workers is None:
+        workers = config.STORAGE_CONCURRENCY
+
+    return ThreadPoolExecutor(
+        max(1, min(workers, config.STORAGE_CONCURRENCY))
+    )
+
+def storage_map(func, items) -> list:
+    ''' Apply func to every item concurrently, see
+        storage_executor. Results are returned in the
+        order of items and the first exception raised
+        by func is re-raised.
+    '''
+
+    items = list(items)
+    if len(items) <= 1:
+        return [func(x) for x in items]
+
+    with storage_executor(len(items)) as executor:
+        return list(executor.map(func, items))
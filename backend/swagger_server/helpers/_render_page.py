@@ -0,0 +1,145 @@
+# Disable method presence checking
+# since pylint is unable to find method
+# definitions for sh
+# pylint: disable=E1101,W0603
+
+from collections import OrderedDict
+
+import os
+import shutil
+import tempfile
+import threading
+import sh
+
+from PyPDF2 import PdfFileReader
+
+from .. import config
+from ._type_check import type_check
+
+# Bounds the number of pages rendered at once by
+# this process, see RENDER_MAX_CONCURRENT
+_render_slots = threading.BoundedSemaphore(config.RENDER_MAX_CONCURRENT)
+
+class RenderBusyError(Exception):
+    ''' Raised when a page can't be rendered because
+        too many renders are already running.
+    '''
+
+# LRU cache of rendered pages, keyed by
+# (filename, page, dpi, width). Filenames
+# are never reused for a different revision
+# so entries never need to be invalidated.
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+def _cache_get(key):
+    with _cache_lock:
+        data = _cache.get(key)
+        if data is not None:
+            _cache.move_to_end(key)
+        return data
+
+def _cache_put(key, data):
+    global _cache_bytes
+
+    if len(data) > config.PAGE_CACHE_MAX_BYTES:
+        return
+
+    with _cache_lock:
+        if key in _cache:
+            return
+
+        _cache[key] = data
+        _cache_bytes += len(data)
+
+        while _cache_bytes > config.PAGE_CACHE_MAX_BYTES:
+            (_, evicted) = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+def _render(pdf_file, outfile, page, dpi):
+    sh.gs(
+        '-q',
+        '-r{:.2f}'.format(dpi),
+        '-dNOPAUSE',
+        '-dBATCH',
+        '-sDEVICE=png16m',
+        '-dFirstPage={}'.format(page),
+        '-dLastPage={}'.format(page),
+        '-sOutputFile={}'.format(outfile),
+        pdf_file
+    )
+
+@type_check
+def render_page_png(container, filename: str, page: int, dpi=None, width=None):
+    ''' Render a single page of a PDF as a PNG image at
+        the requested resolution. The resolution is either
+        given directly as a DPI or as the width in pixels
+        of the resulting image. Results are kept in a
+        bounded in-memory cache.
+
+        The resolution is clamped to RENDER_DPI and
+        RENDER_MAX_WIDTH and at most RENDER_MAX_CONCURRENT
+        pages are rendered at once by the process. A
+        RenderBusyError is raised if no render finishes
+        within RENDER_QUEUE_TIMEOUT seconds.
+
+        Arguments:
+            container: The storage container holding the PDF.
+            filename (str): The blob name of the PDF.
+            page (int): The page number, starting at 1.
+            dpi (int): The resolution to render at.
+            width (int): The width of the image in pixels.
+
+        Returns:
+            The PNG image as bytes or None if the
+            page doesn't exist.
+    '''
+
+    if dpi is not None:
+        dpi = max(1, min(int(dpi), config.RENDER_DPI))
+    elif width is not None:
+        width = max(1, min(int(width), config.RENDER_MAX_WIDTH))
+    else:
+        dpi = config.RENDER_DPI
+
+    key = (filename, page, dpi, width)
+    data = _cache_get(key)
+    if data is not None:
+        return data
+
+    if not _render_slots.acquire(timeout=config.RENDER_QUEUE_TIMEOUT):
+        raise RenderBusyError()
+
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        pdf_file = os.path.join(tmpdir, 'document.pdf')
+        outfile = os.path.join(tmpdir, 'page.png')
+
+        with open(pdf_file, 'wb') as file:
+            container.get_blob(filename).download(file)
+
+        reader = PdfFileReader(pdf_file)
+        if page < 1 or page > reader.getNumPages():
+            return None
+
+        if dpi is None:
+            points = float(reader.getPage(page - 1).mediaBox.getWidth())
+            # Small pages would otherwise be rendered
+            # at an arbitrarily high resolution
+            render_dpi = min(width * 72 / points, config.RENDER_DPI)
+        else:
+            render_dpi = dpi
+
+        _render(pdf_file, outfile, page, render_dpi)
+
+        with open(outfile, 'rb') as file:
+            data = file.read()
+    finally:
+        shutil.rmtree(tmpdir)
+        _render_slots.release()
+
+    _cache_put(key, data)
+
+    return data
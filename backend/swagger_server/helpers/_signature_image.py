@@ -0,0 +1,100 @@
+from uuid import UUID
+from io import BytesIO
+
+import logging
+
+from PIL import Image
+
+# You can't install cloudstorage successfully on
+# windows, disable the warning
+# pylint: disable=E0401
+from cloudstorage.exceptions import NotFoundError
+
+from ._type_check import type_check
+from ._upload_file import upload_file, hash_stream, blob_name
+
+# Suffix of the blob holding the stamp-ready
+# variant of a signature image
+_PROCESSED_SUFFIX = '.flat.png'
+# Suffixes of processed variants stored by earlier
+# versions, these are only deleted
+_LEGACY_SUFFIXES = ('.flat.jpg',)
+
+@type_check
+def processed_name(name: str) -> str:
+    ''' Get the blob name of the processed variant of a
+        signature image, see upload_signature.
+    '''
+    return name + _PROCESSED_SUFFIX
+
+@type_check
+def processed_names(name: str) -> list:
+    ''' Get the blob names of every processed variant a
+        signature image may have, including those stored
+        by earlier versions.
+    '''
+    return [name + x for x in (_PROCESSED_SUFFIX,) + _LEGACY_SUFFIXES]
+
+def _process_image(stream) -> BytesIO:
+    img = Image.open(stream)
+
+    # Discard the alpha channel by compositing onto white
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        flat = Image.new('RGB', img.size, (255, 255, 255))
+        flat.paste(img, mask=img.split()[-1])
+        img = flat
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # Lossless, JPEG artifacts would show around the
+    # strokes of the signature
+    output = BytesIO()
+    img.save(output, 'PNG', optimize=True)
+    output.seek(0)
+
+    return output
+
+@type_check
+def upload_signature(session, container, stream, content_type: str) -> UUID:
+    ''' Store an uploaded signature image like upload_file
+        does, along with a processed variant that is ready
+        to be stamped: the alpha channel is flattened onto
+        white and the result is stored as a lossless RGB
+        PNG so that the stamping engines don't have to
+        flatten it again.
+
+        The processed variant is named after the original
+        blob (see processed_name) so it is shared between
+        identical uploads too. If the image can't be
+        processed only the original is stored and the
+        stamping engine processes it itself.
+
+        Returns:
+            The id of the new File.
+    '''
+
+    digest = hash_stream(stream)
+    file_id = upload_file(session, container, stream, content_type, digest)
+    name = processed_name(blob_name(digest))
+
+    try:
+        container.get_blob(name)
+        return file_id
+    except NotFoundError:
+        pass
+
+    try:
+        stream.seek(0)
+        processed = _process_image(stream)
+    except (IOError, ValueError) as e:
+        logging.error('Failed to process signature image: %s', str(e))
+        return file_id
+
+    container.upload_blob(
+        filename=processed,
+        content_type='image/png',
+        blob_name=name
+    )
+
+    return file_id
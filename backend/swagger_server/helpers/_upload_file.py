@@ -0,0 +1,111 @@
+from uuid import UUID
+
+import uuid
+import hashlib
+
+from sqlalchemy import select, func
+
+from ..mappings import File
+from ._type_check import type_check
+
+# Read size used while hashing uploads
+_HASH_CHUNK_SIZE = 1024 * 1024
+_BLOB_PREFIX = 'sha256-'
+# First key of the advisory locks taken by lock_blob
+_BLOB_LOCK_NAMESPACE = 0x626c6f62
+
+def hash_stream(stream) -> str:
+    ''' Get the SHA-256 hex digest of the contents of a
+        seekable file object, leaving it at the start.
+    '''
+
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(_HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+
+    return digest.hexdigest()
+
+def blob_name(digest: str) -> str:
+    ''' Get the name of the blob storing contents with
+        the given hash, see upload_file.
+    '''
+    return _BLOB_PREFIX + digest
+
+def content_hash(filename):
+    ''' Get the content hash of a blob uploaded through
+        upload_file from its name, or None for blobs
+        that weren't.
+    '''
+
+    if filename and filename.startswith(_BLOB_PREFIX):
+        return filename[len(_BLOB_PREFIX):]
+    return None
+
+@type_check
+def lock_blob(session, name: str):
+    ''' Lock a blob name until the end of the transaction.
+        upload_file holds the lock until the File row that
+        references the blob is committed and delete_blobs
+        holds it while checking that a blob is unreferenced
+        and deleting it, so a blob can't be deleted after
+        upload_file found that it exists.
+    '''
+
+    session.execute(select([
+        func.pg_advisory_xact_lock(_BLOB_LOCK_NAMESPACE, func.hashtext(name))
+    ]))
+
+@type_check
+def upload_file(session, container, stream, content_type: str, digest: str = None) -> UUID:
+    ''' Store an uploaded file, deduplicated by content.
+
+        The blob is named after the SHA-256 hash of its
+        contents so identical uploads share one blob, it
+        is only uploaded if no File already references it.
+        A new File row referencing the blob is added to
+        the session either way. Blobs are reference
+        counted by their File rows, see delete_blobs.
+        The blob stays locked (see lock_blob) until the
+        session's transaction ends.
+
+        Arguments:
+            session: The database session.
+            container: The storage container.
+            stream: A seekable file object with the contents.
+            content_type (str): The MIME type of the contents.
+            digest (str):
+                The hash of the contents if it has already
+                been computed with hash_stream.
+
+        Returns:
+            The id of the new File.
+    '''
+
+    name = blob_name(digest or hash_stream(stream))
+    lock_blob(session, name)
+
+    exists = (
+        session
+            .query(File)
+            .filter(File.filename == name)
+            .with_entities(File.id)
+            .first()
+        is not None
+    )
+
+    if not exists:
+        container.upload_blob(
+            filename=stream,
+            content_type=content_type,
+            blob_name=name
+        )
+
+    file_id = uuid.uuid4()
+
+    session.add(File(
+        id=file_id.bytes,
+        filename=name
+    ))
+
+    return file_id
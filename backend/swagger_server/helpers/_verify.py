@@ -1,8 +1,91 @@
 
 from uuid import UUID
-from flask_jwt_extended import get_jwt_identity
+from collections import OrderedDict
 
-from ..mappings import Document, Field
+import time
+import threading
+
+from flask_jwt_extended import get_jwt_identity, get_jwt_claims
+
+from .. import config, metrics
+from ..mappings import Document, Field, AccessURI
+
+# Granted permissions keyed by (user, document,
+# signer_accessible, target document claim), mapping
+# to the time the entry expires. Denials aren't cached
+# so that fields created by another process take effect
+# immediately, while revocations by another process
+# take up to PERMISSION_CACHE_TTL seconds.
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cache_get(key) -> bool:
+    with _cache_lock:
+        expires = _cache.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del _cache[key]
+            return False
+
+        _cache.move_to_end(key)
+        return True
+
+def _cache_put(key):
+    with _cache_lock:
+        _cache[key] = time.monotonic() + config.PERMISSION_CACHE_TTL
+        _cache.move_to_end(key)
+
+        while len(_cache) > config.PERMISSION_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+def _invalidate(index: int, value: bytes):
+    with _cache_lock:
+        for key in [x for x in _cache if x[index] == value]:
+            del _cache[key]
+
+def invalidate_permission(doc_id):
+    ''' Drop the cached permissions for a document, this
+        must be called whenever the owner or the signers
+        of the document change or it is deleted.
+    '''
+
+    if not isinstance(doc_id, UUID):
+        raise ValueError("doc_id should be a UUID object")
+
+    _invalidate(1, doc_id.bytes)
+
+def invalidate_user_permission(uid):
+    ''' Drop the cached permissions of a user, this must
+        be called whenever the user loses access to their
+        documents, e.g. when their account is deleted.
+    '''
+
+    if not isinstance(uid, UUID):
+        raise ValueError("uid should be a UUID object")
+
+    _invalidate(0, uid.bytes)
+
+def _access_uri_valid(session, uid, target) -> bool:
+    ''' Access tokens carry the document of the access
+        URI they were issued for, they stop working once
+        the user's access URIs for it are revoked.
+    '''
+
+    try:
+        target = UUID(hex=str(target))
+    except ValueError:
+        return False
+
+    return (
+        session
+            .query(AccessURI)
+            .filter(AccessURI.user_id == uid.bytes)
+            .filter(AccessURI.document_id == target.bytes)
+            .filter(AccessURI.revoked != True)
+            .first()
+        is not None
+    )
 
 def verify_permission(session, doc_id, signer_accessible=True):
     if not isinstance(doc_id, UUID):
@@ -10,6 +93,19 @@ def verify_permission(session, doc_id, signer_accessible=True):
 
     uid = UUID(hex=get_jwt_identity())
 
+    # Access tokens are cached separately from
+    # login tokens of the same user
+    target = (get_jwt_claims() or {}).get('target-document')
+    key = (uid.bytes, doc_id.bytes, signer_accessible, str(target) if target else None)
+
+    if _cache_get(key):
+        metrics.increment('permission_cache.hit')
+        return True
+    metrics.increment('permission_cache.miss')
+
+    if target and not _access_uri_valid(session, uid, target):
+        return False
+
     owner = (
         session
             .query(Document)
@@ -19,7 +115,7 @@ def verify_permission(session, doc_id, signer_accessible=True):
         is not None
     )
 
-    return owner or (signer_accessible and (
+    allowed = owner or (signer_accessible and (
         session
             .query(Field)
             .filter(Field.document_id == doc_id.bytes)
@@ -27,3 +123,8 @@ def verify_permission(session, doc_id, signer_accessible=True):
             .first()
         is not None
     ))
+
+    if allowed:
+        _cache_put(key)
+
+    return allowed
@@ -0,0 +1,101 @@
+''' Logging setup, see the LOG_* settings in config.
+
+    Records below WARNING from noisy loggers (SQL statements
+    and per-request logs) are sampled. Requests are sampled
+    before their record is built, see log_request. SQL
+    statements are sampled by a handler filter, which saves
+    formatting and writing the dropped records but not
+    creating them.
+'''
+
+import sys
+import json
+import random
+import logging
+
+from . import config
+
+# Logs one record per request, see app.py
+request_logger = logging.getLogger('swagger_server.request')
+
+def log_request(method: str, path: str, status: int, duration_ms: float):
+    ''' Log a request to request_logger, only a fraction
+        REQUEST_LOG_SAMPLE_RATE of the requests are logged
+        and the record is only built for those.
+    '''
+
+    if not request_logger.isEnabledFor(logging.INFO):
+        return
+    if random.random() >= config.REQUEST_LOG_SAMPLE_RATE:
+        return
+
+    request_logger.info('%s %s %d', method, path, status, extra={
+        'fields': {
+            'method': method,
+            'path': path,
+            'status': status,
+            'duration_ms': duration_ms,
+        }
+    })
+
+class SamplingFilter(logging.Filter):
+    ''' Keep only a fraction of the records below WARNING
+        from the given logger and its children.
+    '''
+
+    def __init__(self, name: str, rate: float):
+        super().__init__()
+        self.prefix = name
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if record.name != self.prefix and \
+                not record.name.startswith(self.prefix + '.'):
+            return True
+        return random.random() < self.rate
+
+class JsonFormatter(logging.Formatter):
+    ''' Format records as one JSON object per line. Values
+        passed through extra={'fields': {...}} are included
+        as top level keys.
+    '''
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+def configure():
+    ''' Set up the root logger and the levels and sampling
+        of the noisy loggers from config.
+    '''
+
+    handler = logging.StreamHandler(sys.stderr)
+    if config.LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s %(name)s: %(message)s'
+        ))
+
+    handler.addFilter(SamplingFilter('sqlalchemy.engine', config.SQL_LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(config.LOG_LEVEL)
+
+    logging.getLogger('sqlalchemy.engine').setLevel(config.SQL_LOG_LEVEL)
+    request_logger.setLevel(config.REQUEST_LOG_LEVEL)
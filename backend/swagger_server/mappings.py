@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Binary, String, ForeignKey, DateTime, Integer
-from sqlalchemy import Boolean
+from sqlalchemy import Boolean, Index
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.ext.declarative import declarative_base
@@ -45,7 +45,7 @@ class User(Base):
     __tablename__ = 'user'
     __versioned__ = {}
     id = Column(Binary(16), primary_key=True, nullable=False)
-    username = Column(String(256), nullable=False)
+    username = Column(String(256), nullable=False, index=True)
     password = Column(Binary(60), nullable=True)
     business_id = Column(Integer(), ForeignKey(Business.id), nullable=False)
     deleted = Column(Boolean(), nullable=False, server_default='0')
@@ -64,7 +64,9 @@ class UserEmail(Base):
 class File(Base):
     __tablename__ = 'file'
     id = Column(Binary(length=16), nullable=False, primary_key=True)
-    filename = Column(String(100), server_default=None)
+    # Uploaded files are named after a hash of their contents
+    # and may be shared by several File rows, see upload_file
+    filename = Column(String(100), server_default=None, index=True)
     request_uri = Column(String(512), server_default=None)
 
     fileusages = relationship('FileUsage')
@@ -88,6 +90,10 @@ class BusinessConfig(Base):
     key = Column(String(128), nullable=False)
     values = Column(JSONB, server_default="{}", nullable=False)
 
+    __table_args__ = (
+        Index('ix_business_config_business_id_key', 'business_id', 'key'),
+    )
+
 class FileUsage(Base):
     __tablename__ = 'fileusage'
     id = Column(Integer(), primary_key=True, nullable=False, autoincrement=True)
@@ -97,14 +103,21 @@ class FileUsage(Base):
     fileusage_type = Column(Integer(), ForeignKey(FileUsageType.id), nullable=False)
     data = Column(JSONB, server_default="{}", nullable=False)
 
+    __table_args__ = (
+        Index(
+            'ix_fileusage_document_id_type_timestamp',
+            'document_id', 'fileusage_type', 'timestamp'
+        ),
+    )
+
 class Field(Base):
     __tablename__ = 'field'
     id = Column(Binary(16), primary_key=True, nullable=False)
-    user_id = Column(Binary(16), ForeignKey(User.id, ondelete="CASCADE"), nullable=True)
-    document_id = Column(Binary(16), ForeignKey(Document.id, ondelete="CASCADE"), nullable=False)
+    user_id = Column(Binary(16), ForeignKey(User.id, ondelete="CASCADE"), nullable=True, index=True)
+    document_id = Column(Binary(16), ForeignKey(Document.id, ondelete="CASCADE"), nullable=False, index=True)
     field_type = Column(Integer(), ForeignKey(FieldType.id), nullable=False)
     field_name = Column(String(512), nullable=False)
-    parent = Column(Binary(16), ForeignKey('field.id'), nullable=True, server_default=None)
+    parent = Column(Binary(16), ForeignKey('field.id'), nullable=True, server_default=None, index=True)
     required = Column(Boolean, server_default="1")
 
     usages = relationship('FieldUsage')
@@ -113,7 +126,7 @@ class Field(Base):
 class AccessURI(Base):
     __tablename__ = 'accessuri'
     id = Column(Integer(), primary_key=True, autoincrement=True)
-    uri = Column(String(1024), nullable=False)
+    uri = Column(String(1024), nullable=False, index=True)
     user_id = Column(Binary(16), ForeignKey(User.id, ondelete="CASCADE"), nullable=False)
     document_id = Column(Binary(16), ForeignKey(Document.id, ondelete="CASCADE"), nullable=False)
     revoked = Column(Boolean(), nullable=False, server_default='0')
@@ -127,6 +140,8 @@ class FieldUsage(Base):
     file_id = Column(Binary(16), ForeignKey(File.id), server_default=None)
     data = Column(JSONB, server_default="{}", nullable=False)
 
+Index('ix_fieldusage_field_id_timestamp', FieldUsage.field_id, FieldUsage.timestamp.desc())
+
 class RenderedPage(Base):
     __tablename__ = 'renderedpage'
     id = Column(Integer(), primary_key=True, autoincrement=True)
@@ -134,6 +149,44 @@ class RenderedPage(Base):
     document_id = Column(Binary(16), ForeignKey(Document.id, ondelete="CASCADE"), nullable=False)
     page = Column(Integer(), nullable=False)
 
+    __table_args__ = (
+        Index('ix_renderedpage_document_id_page', 'document_id', 'page'),
+    )
+
+class FieldState(Base):
+    ''' The current state of each field. This is maintained
+        as FieldUsage rows are inserted (see db.py) so that
+        reads don't have to scan the usage history.
+
+        Fields:
+            usage_id: The latest usage of the field.
+            status: The type of the latest usage.
+            timestamp: When the latest usage happened.
+            filled_usage_id:
+                The latest 'filled' usage, file_id and data
+                are copied from it. None if the field has
+                never been filled.
+    '''
+    __tablename__ = 'field_state'
+    field_id = Column(Binary(16), ForeignKey(Field.id, ondelete="CASCADE"), primary_key=True)
+    usage_id = Column(Integer(), nullable=False)
+    status = Column(Integer(), ForeignKey(FieldUsageType.id), nullable=False)
+    timestamp = Column(DateTime(), nullable=False)
+    filled_usage_id = Column(Integer(), nullable=True)
+    file_id = Column(Binary(16), ForeignKey(File.id), nullable=True)
+    data = Column(JSONB, nullable=True)
+
+class FieldCache(Base):
+    ''' Field extraction results for a PDF, keyed by
+        the SHA-256 hash of its contents. See
+        helpers.get_cached_fields.
+    '''
+    __tablename__ = 'field_cache'
+    hash = Column(String(64), primary_key=True)
+    fields = Column(JSONB, nullable=True)
+    layout = Column(JSONB, nullable=True)
+    last_used = Column(DateTime(), nullable=False, server_default=func.now(), index=True)
+
 # Setup for SQLAlchemy-Continuum
 configure_mappers()
 
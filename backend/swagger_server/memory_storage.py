@@ -0,0 +1,80 @@
+''' In-memory storage driver with the same interface as
+    the cloudstorage drivers used by storage.container().
+    Blobs only live as long as the process, so this is
+    meant for tests and benchmarks (e.g. with celery
+    tasks running eagerly) rather than deployments.
+    In-memory blobs have no download URL, they are
+    always served through the backend.
+'''
+
+import threading
+
+# You can't install cloudstorage successfully on
+# windows, disable the warning
+# pylint: disable=E0401
+from cloudstorage.exceptions import NotFoundError
+
+class MemoryBlob:
+    def __init__(self, container, name: str, data: bytes, content_type: str):
+        self.container = container
+        self.name = name
+        self.data = data
+        self.content_type = content_type
+        self.size = len(data)
+
+    def download(self, destination):
+        if isinstance(destination, str):
+            with open(destination, 'wb') as file:
+                file.write(self.data)
+        else:
+            destination.write(self.data)
+
+    def delete(self):
+        self.container.delete_blob(self.name)
+
+class MemoryContainer:
+    def __init__(self, name: str):
+        self.name = name
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def upload_blob(self, filename, blob_name: str = None, content_type: str = None):
+        if isinstance(filename, str):
+            with open(filename, 'rb') as file:
+                data = file.read()
+        else:
+            data = filename.read()
+
+        blob = MemoryBlob(self, blob_name, bytes(data), content_type)
+
+        with self._lock:
+            self._blobs[blob_name] = blob
+
+        return blob
+
+    def get_blob(self, blob_name: str) -> MemoryBlob:
+        with self._lock:
+            if blob_name not in self._blobs:
+                raise NotFoundError('Blob {} not found'.format(blob_name))
+            return self._blobs[blob_name]
+
+    def delete_blob(self, blob_name: str):
+        with self._lock:
+            if blob_name not in self._blobs:
+                raise NotFoundError('Blob {} not found'.format(blob_name))
+            del self._blobs[blob_name]
+
+class MemoryDriver:
+    ''' Storage driver keeping every blob in memory. The
+        containers are shared by every instance within
+        the process.
+    '''
+
+    _containers = {}
+    _lock = threading.Lock()
+
+    def get_container(self, name: str) -> MemoryContainer:
+        with self._lock:
+            if name not in self._containers:
+                self._containers[name] = MemoryContainer(name)
+            return self._containers[name]
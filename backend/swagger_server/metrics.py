@@ -0,0 +1,58 @@
+''' In-process counters used to monitor resource pools.
+    Values are per process and are exposed as JSON on
+    the /metrics endpoint of the web process, which
+    requires the METRICS_TOKEN bearer token and is
+    disabled when no token is configured. A request
+    only sees the counters of the web process that
+    serves it. Celery workers don't serve HTTP so
+    their counters aren't reachable through /metrics,
+    instead every worker process logs them every
+    METRICS_LOG_INTERVAL seconds, see start_reporter.
+'''
+
+import os
+import time
+import logging
+import threading
+
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+
+_logger = logging.getLogger('swagger_server.metrics')
+
+def increment(name: str, value=1):
+    ''' Add value to the named counter '''
+
+    with _lock:
+        _counters[name] += value
+
+def set_value(name: str, value):
+    ''' Set the named counter, for values that go both
+        up and down such as the size of a pool.
+    '''
+
+    with _lock:
+        _counters[name] = value
+
+def snapshot() -> dict:
+    ''' Get the current value of every counter '''
+
+    with _lock:
+        return dict(_counters)
+
+def start_reporter(interval: int):
+    ''' Log a snapshot of the counters every interval
+        seconds from a background thread, for processes
+        that don't serve /metrics.
+    '''
+
+    def report():
+        while True:
+            time.sleep(interval)
+            _logger.info('metrics', extra={
+                'fields': {'pid': os.getpid(), 'metrics': snapshot()}
+            })
+
+    threading.Thread(target=report, name='metrics-reporter', daemon=True).start()
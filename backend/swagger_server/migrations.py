@@ -0,0 +1,143 @@
+''' Versioned schema migrations.
+
+    New deployments get the whole schema from create_all
+    (see mappings.init), this brings existing databases up
+    to date with changes that create_all doesn't apply to
+    existing tables. Migrations are applied in order and
+    recorded in the schema_migration table, so each one
+    runs once per database. Every statement must be safe
+    to run on a database created by create_all.
+
+    Migrations aren't run by the web or worker processes,
+    run them as a deploy step with `flask migrate-db`.
+    That uses pool.maintenance_engine, without a statement
+    timeout and on a direct connection to PostgreSQL since
+    the advisory lock is held by the session.
+'''
+
+import logging
+
+from sqlalchemy import text
+
+# Serializes migrations run at the same time
+_LOCK_ID = 0x70646673
+
+def _index(name: str, definition: str):
+    ''' Create an index without blocking writes to the
+        table. A failed concurrent build leaves an invalid
+        index behind, which IF NOT EXISTS would skip, so
+        invalid indexes are dropped and built again.
+    '''
+
+    def create(conn):
+        invalid = conn.execute(
+            text(
+                'SELECT 1 FROM pg_index i '
+                'JOIN pg_class c ON c.oid = i.indexrelid '
+                'WHERE c.relname = :name AND NOT i.indisvalid'
+            ),
+            name=name
+        ).first()
+
+        if invalid:
+            logging.warning('Rebuilding invalid index %s', name)
+            conn.execute(text('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name)))
+
+        conn.execute(text(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {}'.format(name, definition)
+        ))
+
+    return create
+
+def _backfill_field_state(conn):
+    from .db import backfill_field_state
+    backfill_field_state(conn)
+
+# Version of the migration filling field_state, until
+# it is applied field states are read from fieldusage
+FIELD_STATE_BACKFILL = 2
+
+# (version, description, steps). Steps are either SQL
+# statements or functions taking the connection, they
+# are run outside of a transaction so that indexes can
+# be created concurrently.
+MIGRATIONS = [
+    (1, 'Indexes for the hot foreign keys', [
+        _index('ix_fieldusage_field_id_timestamp', 'fieldusage (field_id, timestamp DESC)'),
+        _index('ix_fileusage_document_id_type_timestamp',
+               'fileusage (document_id, fileusage_type, timestamp)'),
+        _index('ix_field_document_id', 'field (document_id)'),
+        _index('ix_field_user_id', 'field (user_id)'),
+        _index('ix_field_parent', 'field (parent)'),
+        _index('ix_renderedpage_document_id_page', 'renderedpage (document_id, page)'),
+        _index('ix_accessuri_uri', 'accessuri (uri)'),
+        _index('ix_user_username', '"user" (username)'),
+        _index('ix_business_config_business_id_key', 'business_config (business_id, key)'),
+        _index('ix_file_filename', 'file (filename)'),
+    ]),
+    (FIELD_STATE_BACKFILL, 'Fill field_state from the field usages', [
+        _backfill_field_state,
+    ]),
+]
+
+def _applied(conn) -> set:
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migration ('
+        '    version INTEGER PRIMARY KEY,'
+        '    description VARCHAR(256) NOT NULL,'
+        '    applied_at TIMESTAMP NOT NULL DEFAULT now()'
+        ')'
+    ))
+
+    return set(
+        row[0] for row in conn.execute(text('SELECT version FROM schema_migration'))
+    )
+
+def is_applied(conn, version: int) -> bool:
+    ''' Whether the migration has been applied, conn may
+        be a connection or a session.
+    '''
+
+    exists = conn.execute(
+        text("SELECT to_regclass('schema_migration') IS NOT NULL")
+    ).scalar()
+
+    return bool(exists) and conn.execute(
+        text('SELECT 1 FROM schema_migration WHERE version = :version'),
+        {'version': version}
+    ).first() is not None
+
+def run(engine):
+    ''' Apply all migrations that haven't been applied yet '''
+
+    conn = engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+    try:
+        conn.execute(text('SELECT pg_advisory_lock(:id)'), id=_LOCK_ID)
+
+        try:
+            applied = _applied(conn)
+
+            for (version, description, steps) in MIGRATIONS:
+                if version in applied:
+                    continue
+
+                logging.info('Applying migration %d: %s', version, description)
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(text(step))
+
+                conn.execute(
+                    text(
+                        'INSERT INTO schema_migration (version, description) '
+                        'VALUES (:version, :description)'
+                    ),
+                    version=version,
+                    description=description
+                )
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:id)'), id=_LOCK_ID)
+    finally:
+        conn.close()
@@ -0,0 +1,80 @@
+''' Database connection pooling, see DB_POOL in config '''
+
+import os
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool, NullPool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from . import config, metrics
+
+class TimedQueuePool(QueuePool):
+    ''' QueuePool that records how connection checkouts
+        go in the metrics module: the number of checkouts,
+        the total time spent waiting for a connection, the
+        number of checkouts that timed out and the number
+        of connections currently checked out.
+    '''
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.increment('db.pool.timeouts')
+            raise
+        finally:
+            metrics.increment('db.pool.checkouts')
+            metrics.increment('db.pool.wait_ms', (time.monotonic() - start) * 1000)
+            metrics.set_value('db.pool.checked_out', self.checkedout())
+
+    def _do_return_conn(self, conn):
+        super()._do_return_conn(conn)
+        metrics.set_value('db.pool.checked_out', self.checkedout())
+
+def _setting(settings: dict, name: str) -> int:
+    return int(os.environ.get('DB_' + name.upper(), default=settings[name]))
+
+def engine_options() -> dict:
+    ''' Get the engine options for this process type, to
+        be used as SQLALCHEMY_ENGINE_OPTIONS.
+    '''
+
+    if config.DB_POOL_MODE == 'pgbouncer':
+        # pgbouncer hands out the server connections, so
+        # there's nothing to keep open or to check here
+        return {'poolclass': NullPool}
+
+    settings = config.DB_POOL[config.PROCESS_TYPE]
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_pre_ping': True,
+        'pool_size': _setting(settings, 'pool_size'),
+        'max_overflow': _setting(settings, 'max_overflow'),
+        'pool_timeout': _setting(settings, 'pool_timeout'),
+        'pool_recycle': _setting(settings, 'pool_recycle'),
+    }
+
+    statement_timeout = _setting(settings, 'statement_timeout')
+    if statement_timeout:
+        options['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(statement_timeout)
+        }
+
+    return options
+
+def maintenance_engine():
+    ''' Create an engine for maintenance work such as
+        migrations and backfills. It connects to
+        MAINTENANCE_DATABASE_URI without pooling and with
+        the statement timeout disabled, long statements
+        are expected here.
+    '''
+
+    return create_engine(
+        config.MAINTENANCE_DATABASE_URI,
+        poolclass=NullPool,
+        connect_args={'options': '-c statement_timeout=0'}
+    )
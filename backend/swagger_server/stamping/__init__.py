@@ -0,0 +1,38 @@
+''' Stamping engines used by the stamp_pdf task.
+
+    Every engine is a module exposing the same
+    functions:
+
+        stamp(pdf, fields, images, layout) -> BytesIO
+        render_audit_log(entries) -> BytesIO
+        concat(a, b) -> BytesIO
+
+    The 'http' engine delegates each step to the
+    pdf-service, field-locator and audit-gen services
+    while the 'local' engine performs all of them within
+    the worker process. The engine is selected with the
+    STAMP_ENGINE config value.
+'''
+
+import logging
+
+from .. import config
+from . import http_engine
+
+def get_engine():
+    ''' Get the configured stamping engine, falling back
+        to the http engine if the local engine's
+        dependencies are not installed.
+    '''
+
+    if config.STAMP_ENGINE == 'local':
+        try:
+            from . import local_engine
+            return local_engine
+        except ImportError as e:
+            logging.warning(
+                'Local stamping engine unavailable (%s), using http engine',
+                str(e)
+            )
+
+    return http_engine
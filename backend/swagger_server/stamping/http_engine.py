@@ -0,0 +1,85 @@
+''' Stamping engine that delegates every step to
+    the pdf-service, field-locator and audit-gen
+    services over HTTP.
+'''
+
+from io import BytesIO
+
+import json
+import requests
+
+from .. import config
+
+def locate_fields(pdf: bytes) -> dict:
+    ''' Use the field locator service to get the
+        location of every form field within the PDF.
+    '''
+
+    resp = requests.post(
+        config.FIELD_PARSER_URL + '/locate-fields',
+        pdf,
+        headers={'Content-Type': 'application/pdf'}
+    )
+
+    if resp.status_code != 200:
+        raise Exception(resp.content)
+
+    return json.loads(resp.content.decode('utf8'))
+
+def stamp(pdf: bytes, fields: dict, images: dict, layout: dict = None) -> BytesIO:
+    ''' Fill and flatten the form fields of the PDF
+        then stamp the images on top of it.
+
+        Arguments:
+            pdf (bytes): The PDF form.
+            fields (dict):
+                Field descriptors, mapping field names
+                to {'value': ..., 'type': ...} objects.
+            images (dict):
+                Mapping of image names, as referenced by
+                image field values, to (data, content_type)
+                tuples.
+            layout (dict):
+                The field locations, as returned by the
+                field locator. pdf-service locates the
+                fields itself if this isn't provided.
+    '''
+
+    files = {
+        'file': ('file', pdf, 'application/pdf'),
+        'fields': (None, json.dumps(fields), 'application/json')
+    }
+    if layout and 'fields' in layout:
+        files['layout'] = (None, json.dumps(layout), 'application/json')
+    for (name, (data, content_type)) in images.items():
+        files[name] = (name, data, content_type)
+
+    resp = requests.post(
+        config.PDF_SERVICE_URL + '/stamp',
+        files=files
+    )
+
+    if resp.status_code != 200:
+        raise Exception(resp.content)
+
+    return BytesIO(resp.content)
+
+def render_audit_log(entries: list) -> BytesIO:
+    ''' Render the audit log entries as a PDF '''
+
+    r = requests.post(config.AUDIT_GEN_URL + '/', json=entries)
+
+    if r.status_code != 200:
+        raise Exception(r.content)
+
+    return BytesIO(r.content)
+
+def concat(a, b) -> BytesIO:
+    ''' Concatenate two PDFs '''
+
+    r = requests.post(config.PDF_SERVICE_URL + '/concat', files=dict(a=a, b=b))
+
+    if r.status_code != 200:
+        raise Exception(r.content)
+
+    return BytesIO(r.content)
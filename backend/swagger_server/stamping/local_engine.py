@@ -0,0 +1,321 @@
+''' In-process stamping engine. This does the work of
+    the pdf-service and audit-gen services within the
+    worker, on in-memory buffers, instead of shipping
+    the document between services for every step.
+
+    Form fields are flattened in-process: fields that
+    have a descriptor are drawn from that descriptor
+    while any other widget keeps its current appearance.
+'''
+
+from io import BytesIO
+from collections import defaultdict, OrderedDict
+
+import threading
+
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.pdf import PageObject
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+)
+
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.lib.utils import ImageReader
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph
+from reportlab.lib.styles import getSampleStyleSheet
+
+from PIL import Image
+
+from .. import config
+from . import http_engine
+
+# Largest font size used when drawing text field values
+MAX_FONT_SIZE = 12
+
+# Processed images by name, see _image_reader
+_image_cache = OrderedDict()
+_image_cache_lock = threading.Lock()
+
+AUDIT_MESSAGES = {
+    'viewed': 'Viewed by {} at {} UTC, IP: {}',
+    'created': 'Created by {} at {} UTC, IP: {}',
+    'filled': 'Signed by {} at {} UTC, IP: {}',
+}
+
+# _page_size, _normal_appearance and _place_appearance
+# are copies of those in
+# pdf-service/pdf_backend/inprocess.py
+# since the services are built from separate directories
+# and can't share a module. Keep both copies in sync.
+def _page_size(page):
+    box = page.mediaBox
+    return (float(box.getWidth()), float(box.getHeight()))
+
+def _load_image(data: bytes):
+    ''' Decode an image, discarding the alpha
+        channel by compositing it onto white.
+    '''
+
+    img = Image.open(BytesIO(data))
+    img.load()
+    if img.mode != 'RGBA':
+        return img
+
+    flat = Image.new('RGB', img.size, (255, 255, 255))
+    flat.paste(img, mask=img.split()[-1])
+    return flat
+
+def _image_reader(name, data, content_type):
+    ''' Get an image ready to be drawn. JPEGs are
+        embedded as they are while other images, such as
+        the processed signatures from upload_signature,
+        are decoded. The result is cached by name since
+        image names are blob names, which never change
+        contents.
+    '''
+
+    with _image_cache_lock:
+        processed = _image_cache.get(name)
+        if processed is not None:
+            _image_cache.move_to_end(name)
+
+    if processed is None:
+        if content_type == 'image/jpeg':
+            processed = data
+        else:
+            processed = _load_image(data)
+
+        with _image_cache_lock:
+            _image_cache[name] = processed
+            while len(_image_cache) > config.IMAGE_CACHE_SIZE:
+                _image_cache.popitem(last=False)
+
+    if isinstance(processed, bytes):
+        return ImageReader(BytesIO(processed))
+    return ImageReader(processed)
+
+def _draw_text(canvas, rect, value):
+    size = min(MAX_FONT_SIZE, rect['h'] * 0.8)
+
+    canvas.setFont('Helvetica', size)
+    canvas.drawString(
+        rect['x'] + 2,
+        rect['y'] + (rect['h'] - size) / 2 + size * 0.2,
+        str(value)
+    )
+
+def _create_overlays(reader, layout, fields, images):
+    ''' Draw every filled field onto one overlay per page
+        so that each page only needs a single merge.
+    '''
+
+    by_page = defaultdict(list)
+    for field in layout['fields']:
+        desc = fields.get(field['name'])
+        if not desc or not desc['value'] or desc['type'] == 'blank':
+            continue
+        by_page[field['page']].append((field['rect'], desc))
+
+    decoded = {}
+    overlays = {}
+    for (pgnum, entries) in by_page.items():
+        stream = BytesIO()
+        canvas = Canvas(stream, pagesize=_page_size(reader.getPage(pgnum)))
+
+        for (rect, desc) in entries:
+            if desc['type'] == 'image':
+                name = desc['value']
+                if name not in decoded:
+                    decoded[name] = _image_reader(name, *images[name])
+
+                canvas.drawImage(
+                    decoded[name],
+                    rect['x'], rect['y'], rect['w'], rect['h']
+                )
+            else:
+                _draw_text(canvas, rect, desc['value'])
+
+        canvas.save()
+        overlays[pgnum] = PdfFileReader(stream).getPage(0)
+
+    return overlays
+
+def _normal_appearance(annot):
+    ''' Get the normal appearance stream of a widget
+        for its current state, if it has one.
+    '''
+
+    if '/AP' not in annot:
+        return None
+
+    normal = annot['/AP'].getObject().get('/N')
+    if normal is None:
+        return None
+
+    if isinstance(normal.getObject(), DictionaryObject) and \
+            '/BBox' not in normal.getObject():
+        # Appearance states, e.g. for checkboxes
+        return normal.getObject().get(annot.get('/AS'))
+
+    return normal
+
+def _place_appearance(annot, appearance, name):
+    ''' Content stream operators drawing the appearance
+        XObject over the widget's rectangle.
+    '''
+
+    rect = [float(x) for x in annot['/Rect']]
+    bbox = [float(x) for x in appearance.getObject()['/BBox']]
+
+    bbox_w = (bbox[2] - bbox[0]) or 1
+    bbox_h = (bbox[3] - bbox[1]) or 1
+    sx = (rect[2] - rect[0]) / bbox_w
+    sy = (rect[3] - rect[1]) / bbox_h
+
+    return 'q {} 0 0 {} {} {} cm {} Do Q'.format(
+        sx, sy,
+        rect[0] - bbox[0] * sx,
+        rect[1] - bbox[1] * sy,
+        name
+    )
+
+def _flatten_page(page, skip):
+    ''' Remove all form widgets from the page. Widgets
+        for fields within skip are dropped since they
+        are drawn by the overlay, the others have
+        their appearance drawn into the page content.
+    '''
+
+    if '/Annots' not in page:
+        return
+
+    kept = ArrayObject()
+    ops = []
+    xobjects = DictionaryObject()
+
+    for ref in page['/Annots'].getObject():
+        annot = ref.getObject()
+
+        if annot.get('/Subtype') != '/Widget':
+            kept.append(ref)
+            continue
+        if annot.get('/T') in skip:
+            continue
+
+        appearance = _normal_appearance(annot)
+        if appearance is None or '/BBox' not in appearance.getObject():
+            continue
+
+        name = '/Flat{}'.format(len(xobjects))
+        xobjects[NameObject(name)] = appearance
+        ops.append(_place_appearance(annot, appearance, name))
+
+    page[NameObject('/Annots')] = kept
+
+    if not ops:
+        return
+
+    content = DecodedStreamObject()
+    content.setData('\n'.join(ops).encode('latin-1'))
+
+    overlay = PageObject.createBlankPage(None, *_page_size(page))
+    overlay[NameObject('/Resources')] = DictionaryObject({
+        NameObject('/XObject'): xobjects
+    })
+    overlay[NameObject('/Contents')] = content
+
+    page.mergePage(overlay)
+
+def stamp(pdf: bytes, fields: dict, images: dict, layout: dict = None) -> BytesIO:
+    ''' Fill and flatten the form fields of the PDF
+        then stamp the images on top of it.
+
+        Arguments:
+            pdf (bytes): The PDF form.
+            fields (dict):
+                Field descriptors, mapping field names
+                to {'value': ..., 'type': ...} objects.
+            images (dict):
+                Mapping of image names, as referenced by
+                image field values, to (data, content_type)
+                tuples.
+            layout (dict):
+                The field locations, as returned by the
+                field locator. The field locator is called
+                if this isn't provided.
+    '''
+
+    if not layout or 'fields' not in layout:
+        layout = http_engine.locate_fields(pdf)
+
+    reader = PdfFileReader(BytesIO(pdf))
+    overlays = _create_overlays(reader, layout, fields, images)
+    skip = set(fields.keys())
+
+    writer = PdfFileWriter()
+    for pgnum in range(reader.getNumPages()):
+        page = reader.getPage(pgnum)
+
+        _flatten_page(page, skip)
+        if pgnum in overlays:
+            page.mergePage(overlays[pgnum])
+
+        writer.addPage(page)
+
+    output = BytesIO()
+    writer.write(output)
+    output.seek(0)
+
+    return output
+
+def render_audit_log(entries: list) -> BytesIO:
+    ''' Render the audit log entries as a PDF, this
+        produces the same document as audit-gen.
+    '''
+
+    stream = BytesIO()
+
+    doc = SimpleDocTemplate(
+        stream,
+        pagesize=letter,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=18
+    )
+
+    story = []
+    styles = getSampleStyleSheet()
+
+    for entry in entries:
+        if entry['status'] not in AUDIT_MESSAGES:
+            continue
+
+        story.append(Paragraph(
+            AUDIT_MESSAGES[entry['status']].format(
+                entry['data']['user'],
+                entry['timestamp'],
+                entry['data']['ip']),
+            styles['Normal']
+        ))
+
+    doc.build(story)
+
+    stream.seek(0)
+    return stream
+
+def concat(a, b) -> BytesIO:
+    ''' Concatenate two PDFs '''
+
+    writer = PdfFileWriter()
+    for pdf in (a, b):
+        reader = PdfFileReader(pdf)
+        for pgnum in range(reader.getNumPages()):
+            writer.addPage(reader.getPage(pgnum))
+
+    output = BytesIO()
+    writer.write(output)
+    output.seek(0)
+
+    return output
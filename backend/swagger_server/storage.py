@@ -1,13 +1,182 @@
+''' Access to the blob storage container.
 
-from cloudstorage import get_driver_by_name
-from cloudstorage.drivers.google import GoogleStorageDriver
-from . import config
+    The backend is selected with STORAGE_DRIVER:
 
-def container():
-    storage = GoogleStorageDriver()
-    return storage.get_container(config.STORAGE_CONTAINER)
+        google: Google Cloud Storage (the default)
+        local:
+            Files under LOCALSTORAGE_KEY on the local
+            disk, e.g. for on-prem nodes.
+        memory:
+            Blobs kept in memory by the process, for
+            tests and benchmarks. See memory_storage.
 
-storage = GoogleStorageDriver()
-documents = storage.get_container(config.STORAGE_CONTAINER)
-signatures = storage.get_container(config.STORAGE_CONTAINER)
+    The storage driver and containers are created
+    lazily and shared by every request and task
+    within a process so that authentication and
+    container metadata are only fetched once and
+    HTTP connections are reused. They are recreated
+    after a fork since connections can't be shared
+    between processes.
+'''
 
+# pylint: disable=W0603
+
+import os
+import threading
+
+from datetime import timedelta
+
+from . import config, metrics
+
+_lock = threading.Lock()
+_pid = None
+_driver = None
+_containers = {}
+
+def _reset_if_forked():
+    global _pid
+    global _driver
+
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _driver = None
+        _containers.clear()
+
+def _create_driver():
+    if config.STORAGE_DRIVER == 'local':
+        from cloudstorage.drivers.local import LocalDriver
+        return LocalDriver(key=config.LOCALSTORAGE_KEY)
+    if config.STORAGE_DRIVER == 'memory':
+        from .memory_storage import MemoryDriver
+        return MemoryDriver()
+    if config.STORAGE_DRIVER == 'google':
+        from cloudstorage.drivers.google import GoogleStorageDriver
+        return GoogleStorageDriver()
+
+    raise ValueError('Unknown storage driver {}'.format(config.STORAGE_DRIVER))
+
+def driver():
+    ''' Get the storage driver for the current process '''
+    global _driver
+
+    with _lock:
+        _reset_if_forked()
+
+        if _driver is None:
+            metrics.increment('storage.driver.created')
+            _driver = _create_driver()
+
+        return _driver
+
+def container(name=config.STORAGE_CONTAINER):
+    ''' Get the storage container for the current process '''
+
+    with _lock:
+        _reset_if_forked()
+
+        if name in _containers:
+            metrics.increment('storage.container.hit')
+            return _containers[name]
+
+    metrics.increment('storage.container.miss')
+    if config.STORAGE_DRIVER == 'local':
+        # Creates the directory if it doesn't exist yet
+        result = driver().create_container(name)
+    else:
+        result = driver().get_container(name)
+
+    with _lock:
+        return _containers.setdefault(name, result)
+
+def local_path(blob):
+    ''' Get the path of a blob on the local disk, or
+        None if the blob isn't stored locally.
+    '''
+
+    if config.STORAGE_DRIVER != 'local':
+        return None
+    return blob.cdn_url
+
+def _google_blob(container_name: str, name: str):
+    ''' Get the google-cloud-storage blob for a blob
+        name, this doesn't make a request.
+    '''
+
+    return driver().client.bucket(container_name).blob(name)
+
+def delete_blob(container, name: str):
+    ''' Delete a blob by name without fetching it first.
+        Raises NotFoundError if it doesn't exist.
+    '''
+
+    from cloudstorage.exceptions import NotFoundError
+
+    if config.STORAGE_DRIVER != 'google':
+        # Local lookups, nothing to save
+        container.get_blob(name).delete()
+        return
+
+    from google.api_core.exceptions import NotFound
+
+    try:
+        _google_blob(container.name, name).delete()
+    except NotFound:
+        raise NotFoundError('Blob {} not found'.format(name))
+
+def download_url(container, name: str, expires: int) -> str:
+    ''' Get a signed download URL for a blob by name that
+        expires after the given number of seconds. Google
+        URLs are signed locally without fetching the blob,
+        so they may point to a blob that doesn't exist.
+    '''
+
+    if config.STORAGE_DRIVER != 'google':
+        return container.get_blob(name).generate_download_url(expires=expires)
+
+    # Signed like cloudstorage's generate_download_url
+    return _google_blob(container.name, name).generate_signed_url(
+        expiration=timedelta(seconds=int(expires)),
+        method='GET',
+        content_type=''
+    )
+
+def iter_blob(blob, chunk_size=None):
+    ''' Stream the contents of a blob in chunks of
+        chunk_size bytes (STORAGE_READ_CHUNK_SIZE by
+        default) without buffering the whole blob.
+        Google blobs are read with ranged requests
+        through the driver's client, which handles
+        retries and refreshing credentials.
+    '''
+
+    chunk_size = chunk_size or config.STORAGE_READ_CHUNK_SIZE
+
+    if config.STORAGE_DRIVER == 'memory':
+        data = memoryview(blob.data)
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+        return
+
+    path = local_path(blob)
+    if path is not None:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                yield chunk
+        return
+
+    with _google_blob(blob.container.name, blob.name).open('rb', chunk_size=chunk_size) as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            yield chunk
+
+def read_blob(blob) -> bytes:
+    ''' Read the whole contents of a blob '''
+
+    if config.STORAGE_DRIVER == 'memory':
+        return blob.data
+
+    path = local_path(blob)
+    if path is not None:
+        with open(path, 'rb') as file:
+            return file.read()
+
+    return b''.join(iter_blob(blob))
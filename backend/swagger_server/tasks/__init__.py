@@ -1,5 +1,5 @@
 
-from .stamp_pdf_ import stamp_pdf
+from .stamp_pdf_ import stamp_pdf, schedule_stamp
 from .get_field_info_ import get_field_info
 from .render_pdf_ import render_pdf
 from .delete_blobs_ import delete_blobs
@@ -5,11 +5,15 @@ import logging
 # windows, disable the warning
 # pylint: disable=E0401
 from cloudstorage.exceptions import NotFoundError
+from sqlalchemy.exc import OperationalError
 
 from .. import storage, app
-from ..helpers import type_check
+from ..db import Session
+from ..mappings import File
+from ..helpers import type_check, content_hash, processed_names, storage_map, lock_blob
 
-@app.celery.task
+# Retried on deadlocks with uploads taking several blob locks
+@app.celery.task(autoretry_for=(OperationalError,), max_retries=5)
 @type_check
 def delete_blobs(names: list):
     ''' Delete a list of file blobs, it will continue
@@ -17,15 +21,21 @@ def delete_blobs(names: list):
         exist. Note that this means that a periodic
         cleanup must be done to catch files that this
         task fails to delete. (e.g. if the task creating
-        them is still running)
+        them is still running). Blobs that are still
+        referenced by a File are kept, the references
+        are checked while holding the blob locks (see
+        lock_blob) so that an upload can't start using
+        a blob that is about to be deleted.
 
         Arguments:
             names (list): A list of blob names (as used in the storage container) to delete.
     '''
 
-    print("Starting delete task!")
+    logging.info("Starting delete task for %d blobs", len(names))
+    session = Session()
     container = storage.container()
 
+    valid = []
     for name in names:
         if not isinstance(name, str):
             logging.error(
@@ -33,12 +43,46 @@ def delete_blobs(names: list):
                 str(type(name))
             )
             continue
-        
+        valid.append(name)
+
+    # Locked in a consistent order so that concurrent
+    # deletions can't deadlock with each other
+    valid = sorted(set(valid))
+    for name in valid:
+        lock_blob(session, name)
+
+    # Blobs may be shared by multiple files (see upload_file),
+    # only delete those that no File references anymore
+    referenced = set(
+        x[0] for x in session
+            .query(File)
+            .filter(File.filename.in_(valid))
+            .with_entities(File.filename)
+            .distinct()
+    )
+
+    def delete(name):
         try:
-            blob = container.get_blob(name)
-            blob.delete()
+            storage.delete_blob(container, name)
         except NotFoundError:
             logging.error(
                 "Failed to delete blob %s",
                 str(name)
             )
+
+        # Signature images have a processed variant (see
+        # upload_signature), they are uploaded through
+        # upload_file so other blobs can't have one
+        if content_hash(name) is None:
+            return
+
+        for processed in processed_names(name):
+            try:
+                storage.delete_blob(container, processed)
+            except NotFoundError:
+                pass
+
+    storage_map(delete, [x for x in valid if x not in referenced])
+
+    # Releases the locks
+    session.commit()
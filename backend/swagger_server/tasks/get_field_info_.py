@@ -10,7 +10,8 @@ from .. import storage, config, app
 from ..db import Session
 from ..mappings import *
 from ..ipinfo import *
-from ..helpers import type_check
+from ..helpers import type_check, content_hash
+from ..helpers import get_cached_fields, put_cached_fields
 
 @app.celery.task(autoretry_for=(Exception,), max_retries=5)
 @type_check
@@ -27,7 +28,7 @@ def get_field_info(docId: str):
 
     session = Session()
     container = storage.container()
-    print("Starting get_field_info task for {}".format(docId))
+    logging.info("Starting get_field_info task for %s", docId)
 
     doc_id = UUID(hex=docId)
 
@@ -53,23 +54,34 @@ def get_field_info(docId: str):
     # before this is called
     assert fileName
 
-    stream = BytesIO()
-    blob = container.get_blob(fileName[0])
-    blob.download(stream)
-    stream.seek(0)
-
-    resp = requests.post(
-        config.FIELD_PARSER_URL + '/locate-fields',
-        stream,
-        headers={'Content-Type':'application/pdf'}
-    )
-
-    if resp.status_code != 200:
-        logging.error(
-            'Field locator service returned error:\n%s',
-            str(resp.content)
+    digest = content_hash(fileName[0])
+    content = None
+    if digest:
+        content = get_cached_fields(session, digest, 'layout')
+
+    if content is None:
+        stream = BytesIO()
+        blob = container.get_blob(fileName[0])
+        blob.download(stream)
+        stream.seek(0)
+
+        resp = requests.post(
+            config.FIELD_PARSER_URL + '/locate-fields',
+            stream,
+            headers={'Content-Type':'application/pdf'}
         )
 
+        if resp.status_code != 200:
+            logging.error(
+                'Field locator service returned error:\n%s',
+                str(resp.content)
+            )
+        else:
+            content = json.loads(resp.content.decode('utf8'))
+            if digest:
+                put_cached_fields(session, digest, 'layout', content)
+
+    if content is None:
         # There should always be a fileusage entry,
         # so we add an empty one when the service
         # fails. This can be changed in the future
@@ -80,8 +92,6 @@ def get_field_info(docId: str):
             data="{}"
         ))
     else:
-        content = json.loads(resp.content.decode('utf8'))
-
         index = {}
         for i, field in enumerate(content['fields']):
             index[field['name']] = i
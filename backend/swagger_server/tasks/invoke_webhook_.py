@@ -69,7 +69,7 @@ def invoke_webhooks_fileusage(usage_id: int):
             usage_id (int): FileUsage id that should be invoked.
     '''
 
-    print('invoke_webhooks_fileusage called with {}'.format(usage_id))
+    logging.info('invoke_webhooks_fileusage called with %s', usage_id)
     session = Session()
 
     (doc_id, type_name, timestamp, data) = (
@@ -110,7 +110,7 @@ def invoke_webhooks_fieldusage(usage_id: int):
     '''
 
     session = Session()
-    print('invoke_webhooks_fieldusage called with {}'.format(usage_id))
+    logging.info('invoke_webhooks_fieldusage called with %s', usage_id)
 
     (doc_id, type_name, timestamp, data, field_id, user_id) = (
         session
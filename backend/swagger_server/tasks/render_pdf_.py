@@ -8,22 +8,142 @@ from uuid import UUID
 
 import uuid
 import re
+import json
 import logging
 import shutil
 import tempfile
 import traceback
 import sh
 
-from .. import app, storage
+from concurrent.futures import ThreadPoolExecutor
+from PyPDF2 import PdfFileReader
+
+from .. import app, storage, config
 from ..db import Session
 from ..mappings import *
-from ..helpers import type_check
+from ..helpers import get_field_layout, storage_executor, type_check
+
+def _load_data(data) -> dict:
+    if isinstance(data, dict):
+        return data
+    return json.loads(data)
+
+@type_check
+def split_ranges(ranges: list, num_pages: int, workers: int) -> list:
+    ''' Split page ranges into at most roughly one chunk
+        per worker so that they can be rendered in parallel.
+        Ranges running to the end of the document (last is
+        None) are closed off at num_pages.
+    '''
+
+    ranges = [
+        (first, num_pages if last is None else min(last, num_pages))
+        for (first, last) in ranges
+        if first <= num_pages
+    ]
+
+    total = sum(last - first + 1 for (first, last) in ranges)
+    size = max(1, -(-total // max(1, workers)))
+
+    chunks = []
+    for (first, last) in ranges:
+        while first <= last:
+            end = min(last, first + size - 1)
+            chunks.append((first, end))
+            first = end + 1
+
+    return chunks
+
+def _to_ranges(pages) -> list:
+    ''' Group page numbers into contiguous (first, last) ranges '''
+
+    ranges = []
+    for page in sorted(pages):
+        if ranges and ranges[-1][1] == page - 1:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+
+    return ranges
+
+@type_check
+def get_render_ranges(session, doc_id: UUID, usage_type: int, data: dict) -> list:
+    ''' Work out which pages of the newest revision need to
+        be rendered. Only pages containing fields whose
+        stamped fill differs from the last rendered stamp
+        (see stamp_pdf) are re-rendered, along with the audit
+        log pages which change with every stamp. The other
+        pages keep their previous RenderedPage.
+
+        Returns:
+            A list of (first, last) page ranges, where last is
+            None for a range running to the end of the document.
+    '''
+
+    everything = [(1, None)]
+
+    if usage_type != config.FILE_USAGE_TYPES['endstamp'] or 'fields' not in data:
+        return everything
+
+    stamps = (
+        session
+            .query(FileUsage)
+            .filter(FileUsage.document_id == doc_id.bytes)
+            .filter(FileUsage.fileusage_type == config.FILE_USAGE_TYPES['endstamp'])
+            .filter(FileUsage.file_id.isnot(None))
+            .order_by(FileUsage.timestamp.desc())
+            .with_entities(FileUsage.data)
+            .all()
+    )
+
+    previous = next(
+        (x for x in map(lambda x: _load_data(x[0]), stamps) if x.get('rendered')),
+        None
+    )
+    layout = get_field_layout(session, doc_id)
+
+    # Stamps from before the stamped fields were recorded
+    if not previous or 'fields' not in previous or not layout:
+        return everything
+
+    changed = [
+        name for name in set(previous['fields']) | set(data['fields'])
+        if previous['fields'].get(name) != data['fields'].get(name)
+    ]
+
+    # Page numbers in the field layout start at 0,
+    # GhostScript and RenderedPage start at 1
+    field_pages = {x['name']: x['page'] + 1 for x in layout['fields']}
+    pages = set()
+    for name in changed:
+        if name not in field_pages:
+            return everything
+        pages.add(field_pages[name])
+
+    # Render any page of the original document
+    # that hasn't been rendered before
+    num_pages = len(layout['pages'])
+    rendered = set(
+        x[0] for x in session
+            .query(RenderedPage)
+            .filter(RenderedPage.document_id == doc_id.bytes)
+            .with_entities(RenderedPage.page)
+            .distinct()
+    )
+    pages.update(set(range(1, num_pages + 1)) - rendered)
+
+    # The audit log is appended after the original pages
+    return _to_ranges(pages) + [(num_pages + 1, None)]
 
 def render_pdf_impl(docId: str):
     ''' Render the PDF associated with the document
         using GhostScript and store the resulting
         images within the 'renderedpage' table of
-        the db.
+        the db. Only the pages that changed since
+        the last render are rendered, see
+        get_render_ranges. Pages are rendered by up
+        to RENDER_WORKERS GhostScript processes and
+        uploaded as soon as each one is written.
 
         Arguments:
             docId (str): The document ID, as a hex UUID descriptor.
@@ -32,23 +152,37 @@ def render_pdf_impl(docId: str):
     session = Session()
     container = storage.container()
 
-    print("Starting render_pdf task for document {}".format(docId))
+    logging.info("Starting render_pdf task for document %s", docId)
 
     doc_id = UUID(hex=docId)
 
-    fileName = (
+    current = (
         session
             .query(FileUsage)
             .filter(FileUsage.document_id == doc_id.bytes)
             .join(File)
             .order_by(FileUsage.timestamp.desc())
-            .with_entities(File.filename)
+            .with_entities(
+                FileUsage.id,
+                FileUsage.fileusage_type,
+                FileUsage.data,
+                File.filename
+            )
             .first()
     )
 
     # There should always be at least one file revision
     # at the time this task is run
-    assert fileName
+    assert current
+
+    (usage_id, usage_type, data, filename) = current
+    data = _load_data(data)
+
+    if data.get('rendered'):
+        logging.info("Newest revision of document %s is already rendered", docId)
+        return
+
+    ranges = get_render_ranges(session, doc_id, usage_type, data)
 
     tmpdir = tempfile.mkdtemp()
 
@@ -56,20 +190,16 @@ def render_pdf_impl(docId: str):
         (_, pdf_file) = tempfile.mkstemp(suffix='.pdf', dir=tmpdir)
 
         with open(pdf_file, "wb") as file:
-            blob = container.get_blob(fileName[0])
+            blob = container.get_blob(filename)
             blob.download(file)
 
-        def process_line(line):
-            match = re.match(r'^Page ([0-9]+)', line)
-
-            if not match:
-                return
+        num_pages = PdfFileReader(pdf_file).getNumPages()
+        chunks = split_ranges(ranges, num_pages, config.RENDER_WORKERS)
 
-            pagenum = int(match.group(1))
+        def process_page(pagenum, image):
             file_id = uuid.uuid4()
 
-            filename = "{}/page-{}.png".format(tmpdir, pagenum)
-            with open(filename, "rb") as file:
+            with open(image, "rb") as file:
                 container.upload_blob(
                     file,
                     blob_name=file_id.hex,
@@ -89,33 +219,77 @@ def render_pdf_impl(docId: str):
 
             return (file, page)
 
-        lines = sh.gs(
-            '-r300',
-            '-dNOPAUSE',
-            '-dBATCH',
-            '-sDEVICE=png16m',
-            '-sOutputFile={}/page-%d.png'.format(tmpdir),
-            pdf_file,
-        )
+        def render_chunk(uploader, first, last):
+            prefix = "{}/range-{}".format(tmpdir, first)
+            uploads = []
+            rendered = []
+
+            def upload_previous():
+                # Output files are numbered from 1 within the chunk
+                image = "{}-page-{}.png".format(prefix, len(rendered))
+                uploads.append(uploader.submit(process_page, rendered[-1], image))
+
+            def process_line(line):
+                # GhostScript prints the document page number
+                # when it starts a page, so the previous page
+                # is complete and can be uploaded
+                match = re.match(r'^Page ([0-9]+)', line)
+
+                if not match:
+                    return
+
+                if rendered:
+                    upload_previous()
+                rendered.append(int(match.group(1)))
+
+            sh.gs(
+                '-r{}'.format(config.RENDER_DPI),
+                '-dNOPAUSE',
+                '-dBATCH',
+                '-sDEVICE=png16m',
+                '-dFirstPage={}'.format(first),
+                '-dLastPage={}'.format(last),
+                '-sOutputFile={}-page-%d.png'.format(prefix),
+                pdf_file,
+                _out=process_line
+            )
+
+            if rendered:
+                upload_previous()
+
+            return uploads
 
-        lines = [x for x in lines]
         files = []
         pages = []
 
-        for line in lines:
-            ln = process_line(line)
+        # Each chunk runs in its own GhostScript process,
+        # the threads only wait on GhostScript and uploads
+        with ThreadPoolExecutor(config.RENDER_WORKERS) as renderer, \
+                storage_executor() as uploader:
+            renders = [
+                renderer.submit(render_chunk, uploader, first, last)
+                for (first, last) in chunks
+            ]
 
-            if not ln:
-                continue
-
-            file, page = ln
-            files.append(file)
-            pages.append(page)
+            for render in renders:
+                for upload in render.result():
+                    file, page = upload.result()
+                    files.append(file)
+                    pages.append(page)
 
         session.add_all(files)
         session.flush()
         session.add_all(pages)
 
+        if usage_type == config.FILE_USAGE_TYPES['endstamp']:
+            data['rendered'] = True
+            (
+                session
+                    .query(FileUsage)
+                    .filter(FileUsage.id == usage_id)
+                    .update({'data': json.dumps(data)}, synchronize_session=False)
+            )
+
         session.commit()
     except sh.ErrorReturnCode_1 as e:
         logging.error(str(e) + '\n' + traceback.format_exc())
@@ -126,10 +300,10 @@ def render_pdf_impl(docId: str):
 @app.celery.task(autoretry_for=(Exception,), max_retries=5)
 @type_check
 def render_pdf(docId: str):
-    ''' Render the PDF associated with the document
-        using GhostScript and store the resulting
-        images within the 'renderedpage' table of
-        the db.
+    ''' Render the pages of the PDF associated with the
+        document that changed since it was last rendered
+        using GhostScript and store the resulting images
+        within the 'renderedpage' table of the db.
 
         Arguments:
             docId (str): The document ID, as a hex UUID descriptor.
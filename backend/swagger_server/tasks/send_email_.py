@@ -161,7 +161,7 @@ def _send_email_internal(docId: str, tgtemail):
     doc_id = UUID(hex=docId)
     session = Session()
 
-    print("Starting email task for document {}".format(docId))
+    logging.info("Starting email task for document %s", docId)
 
     business = (
         session
@@ -4,218 +4,207 @@ from uuid import UUID
 
 import uuid
 import json
-import traceback
-import requests
+import logging
 
 from sqlalchemy.sql import func
 
-from .. import storage, config, app
-from ..db import Session
+# You can't install cloudstorage successfully on
+# windows, disable the warning
+# pylint: disable=E0401
+from cloudstorage.exceptions import NotFoundError
+
+from .. import storage, config, app, stamping
+from ..db import Session, field_state
 from ..mappings import *
 from ..ipinfo import *
-from ..helpers import fetch_audit, download_blob_stream, type_check
+from ..helpers import fetch_audit, download_blob_stream, get_field_layout, type_check
+from ..helpers import processed_name, storage_executor
 
 from .render_pdf_ import render_pdf
 from .invoke_webhook_ import invoke_webhooks_fieldusage
 
 @type_check
-def get_signed_fields(session, doc_id: UUID):
-    '''Get all fields that have already been filled'''
-
-    rownum = func.row_number().over(
-        partition_by=FieldUsage.field_id,
-        order_by=FieldUsage.timestamp.desc()
-    ).label("row_number")
-
-    subquery = (
-        session
-            .query(FieldUsage)
-            .join(File, isouter=True)
-            .join(Field)
-            .filter(Field.document_id == doc_id.bytes)
-            .filter(FieldUsage.fieldusage_type == config.FIELD_USAGE_TYPE['filled'])
-            .filter(Field.field_type == config.FIELD_TYPE['signature'])
-            .add_column(rownum)
-            .with_entities(File.filename, Field.field_name, rownum)
-            .subquery()
-    )
-
-    return (
-        session
-            .query(subquery)
-            .filter(subquery.c.row_number == 1)
-            .with_entities(subquery.c.filename, subquery.c.field_name)
-            .all()
-    )
-
-@type_check
-def get_text_fields(session, doc_id: UUID):
-    '''Get all non-signature fields that have been filled'''
-
-    rownum = func.row_number().over(
-        partition_by=FieldUsage.field_id,
-        order_by=FieldUsage.timestamp.desc()
-    ).label("row_number")
-
-    subquery = (
+def get_stamp_state(session, doc_id: UUID):
+    ''' Get everything needed to stamp the document in
+        a single query: the original PDF and, for every
+        field, its latest 'filled' usage if there is one
+        as recorded in field_state.
+
+        Returns:
+            A tuple (doc_file, descriptors, images, stamped)
+            where doc_file is the blob name of the document,
+            descriptors maps field names to stamp field
+            descriptors, images is the list of blob names of
+            the signatures to stamp and stamped maps field
+            names to the id of the 'filled' usage that is
+            stamped, or None.
+    '''
+
+    doc_file = (
         session
-            .query(FieldUsage)
-            .join(Field)
-            .filter(Field.document_id == doc_id.bytes)
-            .filter(FieldUsage.fieldusage_type == config.FIELD_USAGE_TYPE['filled'])
-            .filter(Field.field_type != config.FIELD_TYPE['signature'])
-            .add_column(rownum)
-            .with_entities(FieldUsage.data, Field.field_name, rownum)
-            .subquery()
+            .query(FileUsage)
+            .join(File)
+            .filter(FileUsage.document_id == doc_id.bytes)
+            .order_by(FileUsage.timestamp.asc())
+            .with_entities(File.filename)
+            .limit(1)
+            .as_scalar()
     )
 
-    return map(
-        lambda x: (json.loads(x[0]).get('value'), x[1]),
-        session
-            .query(subquery)
-            .filter(subquery.c.row_number == 1)
-            .with_entities(
-                subquery.c.data,
-                subquery.c.field_name
-            )
-            .all()
-    )
-@type_check
-def get_unfilled_fields(session, doc_id: UUID):
-    subquery = (
-        session
-            .query(Field)
-            .join(FieldUsage)
-            .join(FieldUsageType)
-            .filter(FieldUsageType.name == 'filled')
-            .filter(Field.document_id == doc_id.bytes)
-            .with_entities(Field.id)
-            .distinct()
-    )
+    state = field_state(session, Field.document_id == doc_id.bytes)
 
-    return (
+    # Outer joins from the document so that there is
+    # a row even if the document has no fields
+    rows = (
         session
-            .query(Field)
-            .filter(~Field.id.in_(subquery))
-            .filter(Field.document_id == doc_id.bytes)
+            .query(Document)
+            .filter(Document.id == doc_id.bytes)
+            .outerjoin(Field, Field.document_id == Document.id)
+            .outerjoin(state, state.c.field_id == Field.id)
+            .outerjoin(File, File.id == state.c.file_id)
             .with_entities(
-                Field.field_name
+                doc_file,
+                Field.field_name,
+                Field.field_type,
+                state.c.filled_usage_id,
+                state.c.data,
+                File.filename
             )
             .all()
     )
 
-@type_check
-def get_document_file(session, doc_id: UUID):
-    row = (
-        session
-            .query(FileUsage)
-            .join(File)
-            .filter(FileUsage.document_id == doc_id.bytes
-                and (FileUsage.fileusage_type == config.FILE_USAGE_TYPES['created']
-                or FileUsage.fileusage_type == config.FILE_USAGE_TYPES['updated']))
-            .order_by(FileUsage.timestamp.asc())
-            .with_entities(File.filename)
-            .first()
-    )
-
     # The document should never be null
-    assert row
+    assert rows and rows[0][0]
 
-    return row[0]
-
-@type_check
-def do_stamp_pdf(session, container, doc_id: UUID):
-    signatures = get_signed_fields(session, doc_id)
-    textvals = get_text_fields(session, doc_id)
-    empty = get_unfilled_fields(session, doc_id)
-    doc_file = get_document_file(session, doc_id)
-
-    descriptors = {
-        x[1]: {
-            'value': x[0],
-            'type': 'blank' if x[0] is None else 'image'
-        }
-        for x in signatures
-    }
-
-    descriptors.update({
-        x[1]: {
-            'value': x[0],
-            'type': 'blank' if x[0] is None else 'text'
-        }
-        for x in textvals
-    })
-
-    # Blank out unfilled fields
-    descriptors.update({
-        x[0]: {
-            'value': '',
-            'type': 'blank'
-        }
-        for x in empty
-    })
-
-    doc_blob = container.get_blob(doc_file)
-
-    files = {
-        'file': ('file', download_blob_stream(doc_blob), 'application/pdf'),
-        'fields': (None, json.dumps(descriptors), 'application/json')
-    }
-    for (name, _) in signatures:
-        if not name:
+    descriptors = {}
+    images = []
+    stamped = {}
+    for (_, name, ty, filled, data, filename) in rows:
+        if name is None:
             continue
 
-        blob = container.get_blob(name)
-        files[name] = (
-            name,
-            download_blob_stream(blob),
-            blob.content_type
-        )
+        stamped[name] = filled
+
+        if filled is None:
+            # Blank out unfilled fields
+            descriptors[name] = {'value': '', 'type': 'blank'}
+        elif ty == config.FIELD_TYPE['signature']:
+            descriptors[name] = {
+                'value': filename,
+                'type': 'blank' if filename is None else 'image'
+            }
+            if filename is not None:
+                images.append(filename)
+        else:
+            if not isinstance(data, dict):
+                data = json.loads(data)
+            value = data.get('value')
+
+            descriptors[name] = {
+                'value': value,
+                'type': 'blank' if value is None else 'text'
+            }
+
+    return (rows[0][0], descriptors, images, stamped)
 
-    resp = requests.post(
-        config.PDF_SERVICE_URL + '/stamp',
-        files=files
+@type_check
+def do_stamp_pdf(session, container, doc_id: UUID, engine) -> tuple:
+    ''' Stamp the fields onto the document, returns the
+        stamped PDF and the stamped field state (see
+        get_stamp_state).
+    '''
+
+    (doc_file, descriptors, signatures, stamped) = get_stamp_state(session, doc_id)
+
+    def download_image(name):
+        # Prefer the stamp-ready variant, older
+        # signatures may not have one
+        try:
+            blob = container.get_blob(processed_name(name))
+        except NotFoundError:
+            blob = container.get_blob(name)
+
+        return (download_blob_stream(blob), blob.content_type)
+
+    names = list(set(signatures))
+
+    # Fetch the document and all the images concurrently
+    with storage_executor(len(names) + 1) as executor:
+        doc_future = executor.submit(
+            lambda: download_blob_stream(container.get_blob(doc_file))
+        )
+        images = dict(zip(names, executor.map(download_image, names)))
+        doc_data = doc_future.result()
+
+    stamped_pdf = engine.stamp(
+        doc_data,
+        descriptors,
+        images,
+        get_field_layout(session, doc_id)
     )
 
-    if resp.status_code != 200:
-        raise Exception(resp.content)
-
-    return BytesIO(resp.content)
+    return (stamped_pdf, stamped)
 
 @type_check
-def do_get_audit_log(session, doc_id: UUID):
+def do_get_audit_log(session, doc_id: UUID, engine) -> BytesIO:
     log = fetch_audit(session, doc_id)
-    r = requests.post('http://audit-gen/', json=[x.to_dict() for x in log])
+    return engine.render_audit_log([x.to_dict() for x in log])
 
-    if r.status_code != 200:
-        raise Exception(r.content)
-
-    return BytesIO(r.content)
+@type_check
+def do_concat_pdf(a, b, engine) -> BytesIO:
+    return engine.concat(a, b)
 
 @type_check
-def do_concat_pdf(a, b) -> BytesIO:
-    r = requests.post(config.PDF_SERVICE_URL + '/concat', files=dict(a=a, b=b))
+def get_latest_field_usage(session, doc_id: UUID) -> int:
+    '''Get the id of the newest FieldUsage for the document, or 0'''
 
-    if r.status_code != 200:
-        raise Exception(r.content)
+    latest = (
+        session
+            .query(FieldUsage)
+            .join(Field)
+            .filter(Field.document_id == doc_id.bytes)
+            .with_entities(func.max(FieldUsage.id))
+            .scalar()
+    )
 
-    return BytesIO(r.content)
+    return latest or 0
 
 @app.celery.task(autoretry_for=(Exception,), max_retries=5)
 @type_check
-def stamp_pdf(docId: str):
+def stamp_pdf(docId: str, token: int = None):
+    ''' Stamp all filled fields onto the document, append
+        the audit log and store the result as a new
+        revision of the document.
+
+        Arguments:
+            docId (str): The document ID, as a hex UUID descriptor.
+            token (int):
+                The newest FieldUsage id for the document
+                when the stamp was scheduled. If the document
+                has a newer FieldUsage then a later stamp has
+                been scheduled and this one is skipped. See
+                schedule_stamp.
+    '''
+
     doc_id = uuid.UUID(hex=docId)
     session = Session()
+
+    latest = get_latest_field_usage(session, doc_id)
+    if token is not None and latest > token:
+        logging.info("Skipping stamp task for document %s, a newer one is queued", docId)
+        return
+
     fileid = uuid.uuid4()
     container = storage.container()
+    engine = stamping.get_engine()
     persisted = False
 
-    print("Starting stamp task for document {}".format(docId))
+    logging.info("Starting stamp task for document %s", docId)
     try:
-        stamped_pdf = do_stamp_pdf(session, container, doc_id)
-        audit_log = do_get_audit_log(session, doc_id)
+        (stamped_pdf, stamped) = do_stamp_pdf(session, container, doc_id, engine)
+        audit_log = do_get_audit_log(session, doc_id, engine)
 
-        final_pdf = do_concat_pdf(stamped_pdf, audit_log)
+        final_pdf = do_concat_pdf(stamped_pdf, audit_log, engine)
 
         container.upload_blob(
             final_pdf,
@@ -231,21 +220,28 @@ def stamp_pdf(docId: str):
         session.commit()
         persisted = True
 
+        # Record the fill stamped for each field so that
+        # render_pdf can tell which fields changed since
+        # the previous stamp. FieldUsage ids don't commit
+        # in order so they can't be used as a watermark.
         session.add(FileUsage(
             file_id=fileid.bytes,
             document_id=doc_id.bytes,
-            fileusage_type=config.FILE_USAGE_TYPES['endstamp']
+            fileusage_type=config.FILE_USAGE_TYPES['endstamp'],
+            data=json.dumps({
+                'fields': stamped
+            })
         ))
 
         session.commit()
 
-        render_pdf.delay(docId)
+        if config.PRERENDER_PAGES:
+            render_pdf.delay(docId)
     except Exception as e:
         session.rollback()
 
         if not persisted:
-            print(e)
-            traceback.print_exc()
+            logging.exception("Stamp task for document %s failed", docId)
             raise
 
         usage = FileUsage(
@@ -261,6 +257,22 @@ def stamp_pdf(docId: str):
         session.refresh(usage)
         invoke_webhooks_fieldusage.delay(usage.id)
 
+@type_check
+def schedule_stamp(session, doc_id: UUID):
+    ''' Queue a stamp of the document once the debounce
+        window has passed. Stamps scheduled for the same
+        document within the window are coalesced, only
+        the one scheduled last will run. That stamp is
+        always run so the last fill is always reflected.
+
+        This must be called after the changes that should
+        be stamped have been committed.
+    '''
+
+    stamp_pdf.apply_async(
+        (doc_id.hex, get_latest_field_usage(session, doc_id)),
+        countdown=config.STAMP_DEBOUNCE_SECONDS
+    )
 
 def queue_stamping(docId, _):
     stamp_pdf.delay(uuid.UUID(bytes=docId).hex)
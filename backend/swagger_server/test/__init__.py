@@ -0,0 +1,36 @@
+''' Integration tests, these need the DATABASE_URI of a
+    PostgreSQL database that they are free to write to.
+    Blobs are kept in memory and celery tasks run eagerly.
+'''
+
+import os
+import unittest
+
+if os.environ.get('DATABASE_URI'):
+    os.environ['STORAGE_DRIVER'] = 'memory'
+    os.environ.setdefault(
+        'FLASK_CONFIG',
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.py')
+    )
+
+requires_db = unittest.skipUnless(
+    os.environ.get('DATABASE_URI'),
+    'DATABASE_URI is not set'
+)
+
+def create_app():
+    ''' Create the application, with celery tasks
+        running within the calling process.
+    '''
+
+    from .. import app, db
+
+    if not hasattr(app, 'flask_app'):
+        app.main()
+        app.celery.conf.task_always_eager = True
+        app.celery.conf.task_eager_propagates = True
+
+    with app.flask_app.app_context():
+        db.init_db(app.sqldb.engine)
+
+    return app
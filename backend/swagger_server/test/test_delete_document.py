@@ -0,0 +1,130 @@
+import io
+import uuid
+import unittest
+
+from . import requires_db, create_app
+
+@requires_db
+class TestDeleteDocument(unittest.TestCase):
+    ''' Deleting a document removes the blobs of its
+        revisions and rendered pages, except for blobs
+        still used by another document.
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+
+    def setUp(self):
+        from flask_jwt_extended import create_access_token
+        from ... import storage, db
+        from ...mappings import User
+
+        self.container = storage.container()
+        self.session = db.Session.session_factory()
+        self.client = self.app.flask_app.test_client()
+
+        self.uid = uuid.uuid4()
+        self.session.add(User(
+            id=self.uid.bytes,
+            username='delete-test-{}@example.com'.format(self.uid.hex),
+            password=None,
+            business_id=1
+        ))
+        self.session.commit()
+
+        with self.app.flask_app.app_context():
+            self.token = create_access_token(identity=self.uid)
+
+    def tearDown(self):
+        self.session.close()
+
+    def create_document(self, contents: bytes) -> tuple:
+        ''' Create a document with an uploaded PDF, a stamped
+            revision and a rendered page. Returns the id of the
+            document and the blob names of its files.
+        '''
+        from ... import config
+        from ...helpers import upload_file
+        from ...mappings import Document, File, FileUsage, RenderedPage
+
+        doc_id = uuid.uuid4()
+        self.session.add(Document(id=doc_id.bytes, title='Test', user_id=self.uid.bytes))
+        self.session.flush()
+
+        names = []
+        for (data, usage) in ((contents, 'created'), (contents + b'stamped', 'endstamp')):
+            file_id = upload_file(
+                self.session, self.container, io.BytesIO(data), 'application/pdf'
+            )
+            self.session.add(FileUsage(
+                file_id=file_id.bytes,
+                document_id=doc_id.bytes,
+                fileusage_type=config.FILE_USAGE_TYPES[usage]
+            ))
+            self.session.flush()
+            names.append(self.session.query(File).get(file_id.bytes).filename)
+
+        page_id = uuid.uuid4()
+        self.container.upload_blob(io.BytesIO(b'png'), blob_name=page_id.hex)
+        self.session.add(File(id=page_id.bytes, filename=page_id.hex))
+        self.session.flush()
+        self.session.add(RenderedPage(file_id=page_id.bytes, document_id=doc_id.bytes, page=1))
+        names.append(page_id.hex)
+
+        self.session.commit()
+
+        return (doc_id, names)
+
+    def delete_document(self, doc_id):
+        response = self.client.delete(
+            '/v1/document/{}'.format(doc_id.hex),
+            headers={'Authorization': 'Bearer {}'.format(self.token)}
+        )
+        self.assertEqual(response.status_code, 204)
+
+    def blob_exists(self, name: str) -> bool:
+        from cloudstorage.exceptions import NotFoundError
+
+        try:
+            self.container.get_blob(name)
+            return True
+        except NotFoundError:
+            return False
+
+    def test_delete_removes_blobs(self):
+        from ...mappings import File
+
+        (doc_id, names) = self.create_document(uuid.uuid4().bytes)
+        for name in names:
+            self.assertTrue(self.blob_exists(name))
+
+        self.delete_document(doc_id)
+
+        self.session.expire_all()
+        self.assertEqual(
+            self.session.query(File).filter(File.filename.in_(names)).count(),
+            0
+        )
+        for name in names:
+            self.assertFalse(self.blob_exists(name))
+
+    def test_delete_keeps_shared_blobs(self):
+        contents = uuid.uuid4().bytes
+        (first, names) = self.create_document(contents)
+        (second, shared) = self.create_document(contents)
+
+        # Identical uploads share the revision blobs
+        self.assertEqual(names[:2], shared[:2])
+
+        self.delete_document(first)
+        for name in shared:
+            self.assertTrue(self.blob_exists(name))
+        self.assertFalse(self.blob_exists(names[2]))
+
+        self.delete_document(second)
+        for name in shared:
+            self.assertFalse(self.blob_exists(name))
+
+if __name__ == '__main__':
+    unittest.main()
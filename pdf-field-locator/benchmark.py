@@ -0,0 +1,52 @@
+''' Compare the time taken by parse_pdf, which interprets
+    the content of every page, and scan_pdf, which only
+    reads the annotations, on the sample PDFs.
+
+    Usage: python benchmark.py [iterations] [pdf...]
+'''
+
+import os
+import sys
+import timeit
+
+from io import BytesIO
+
+from main import parse_pdf, scan_pdf
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_FILES = [
+    os.path.join(ROOT, 'sample.pdf'),
+    os.path.join(ROOT, 'all-types.pdf')
+]
+
+def run(parser, data):
+    result = parser(BytesIO(data))
+
+    # parse_pdf returns generators, consume them
+    # like json.dumps does within the endpoint
+    return {
+        'pages': list(result['pages']),
+        'fields': list(result['fields'])
+    }
+
+def main(argv):
+    iterations = int(argv[1]) if len(argv) > 1 else 20
+    files = argv[2:] or DEFAULT_FILES
+
+    for filename in files:
+        with open(filename, 'rb') as f:
+            data = f.read()
+
+        assert run(parse_pdf, data) == run(scan_pdf, data), \
+            'Results differ for {}'.format(filename)
+
+        print(os.path.basename(filename))
+        for parser in (parse_pdf, scan_pdf):
+            total = timeit.timeit(lambda: run(parser, data), number=iterations)
+            print('  {:<10} {:8.2f} ms'.format(
+                parser.__name__,
+                total * 1000 / iterations
+            ))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -1,5 +1,10 @@
 
-from io import BytesIO
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+
+import os
+import mmap
+import shutil
 import simplejson as json
 
 from flask import Flask, request
@@ -17,6 +22,11 @@ app = Flask(__name__)
 CORS(app)
 Sentry(app, dsn='')
 
+# Request bodies larger than this many bytes are
+# spooled to disk instead of being kept in memory
+SPOOL_MAX_MEMORY = int(os.environ.get('SPOOL_MAX_MEMORY', 1024 * 1024))
+SPOOL_CHUNK_SIZE = 64 * 1024
+
 class Rect:
     def __init__(self, rect):
         self.x = rect[0]
@@ -116,6 +126,52 @@ def parse_pdf(pdf):
         'fields': parse_all_annotations(pdf, interpreter)
     }
 
+def scan_pdf(pdf):
+    ''' Same result as parse_pdf, but only reads the page
+        tree and the widget dictionaries in a single pass
+        without interpreting any page content, which is
+        all that is needed to locate form fields.
+    '''
+
+    pages = []
+    fields = []
+
+    for pgnum, page in enumerate(PDFPage.get_pages(pdf)):
+        rect = page.mediabox
+        pages.append({
+            'width': rect[2],
+            'height': rect[3]
+        })
+
+        if page.annots:
+            fields.extend(parse_annotations(page, pgnum))
+
+    return {
+        'pages': pages,
+        'fields': fields
+    }
+
+@contextmanager
+def spool_body(stream):
+    ''' Copy the request body into a temporary file in
+        chunks. Small bodies stay in memory, larger ones
+        go to disk and are memory mapped so that the parser
+        reads them through the page cache rather than from
+        a copy on the heap.
+    '''
+
+    with SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+        shutil.copyfileobj(stream, spool, SPOOL_CHUNK_SIZE)
+        size = spool.tell()
+        spool.seek(0)
+
+        if size <= SPOOL_MAX_MEMORY:
+            yield spool
+            return
+
+        spool.flush()
+        with mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
 
 @app.route('/locate-fields', methods=['POST'])
 def locate_fields():
@@ -125,10 +181,11 @@ def locate_fields():
         }), 415
 
     try:
-        return json.dumps(
-            parse_pdf(BytesIO(request.stream.read())),
-            iterable_as_array=True
-        ), 200
+        with spool_body(request.stream) as pdf:
+            return json.dumps(
+                scan_pdf(pdf),
+                iterable_as_array=True
+            ), 200
 
     except PDFSyntaxError as e:
         return json.dumps({
@@ -2,23 +2,17 @@
 import os
 import shutil
 import tempfile
-import sh
 
-def _invoke_pdftk(*args, outname):
-    assert outname
-    sh.pdftk(
-        *args,
-        "cat",
-        "output",
-        outname
-    )
+import pdf_backend
+
+from spool import CHUNK_SIZE
 
 def _write_files(*pdfs):
     for stream in list(pdfs):
         _, name = tempfile.mkstemp('.pdf')
 
         with open(name, 'wb') as file:
-            shutil.copyfileobj(stream, file)
+            shutil.copyfileobj(stream, file, CHUNK_SIZE)
 
         yield name
 
@@ -27,7 +21,7 @@ def concat_pdfs(*pdfs):
 
     inputs = [x for x in _write_files(*pdfs)]
 
-    _invoke_pdftk(*inputs, outname=outfile)
+    pdf_backend.concat(inputs, outfile)
 
     for name in inputs:
         os.unlink(name)
@@ -4,8 +4,8 @@ import shutil
 import json
 
 from json import JSONDecodeError
-from io import BytesIO
-from tempfile import mkstemp, mkdtemp
+from collections import defaultdict
+from tempfile import mkdtemp
 from pdfminer.pdfparser import PDFSyntaxError
 
 from flask import (
@@ -17,10 +17,12 @@ from raven.contrib.flask import Sentry
 
 from field_parser import get_fields
 from concat import concat_pdfs
+from spool import SpoolingRequest, spooled_file
 from sign.stamp import FieldExtractionFailedException
 from sign import sign_and_fill, save_all_files, InvalidFieldTypeError
 
 app = Flask(__name__)
+app.request_class = SpoolingRequest
 CORS(app)
 Sentry(app, dsn='')
 
@@ -47,8 +49,6 @@ def stamp():
         return jsonify(msg="Missing Content-Type header"), 400
 
     tmpdir = mkdtemp()
-    fd, outname = mkstemp(dir=tmpdir)
-    os.close(fd)
 
     # pylint: disable=W0612
     @after_this_request
@@ -65,9 +65,24 @@ def stamp():
     if not isinstance(fields, dict):
         return jsonify(msg='fields was not an object'), 400
 
-    name_map = {
-        v['value']: k for k, v in fields.items() if v['value'] is not None
-    }
+    # The field locations are optional, they're
+    # requested from the field locator if absent
+    layout = None
+    if 'layout' in request.form:
+        try:
+            layout = json.loads(request.form['layout'])
+        except JSONDecodeError as e:
+            return jsonify(msg=e.msg), 400
+
+        if not isinstance(layout, dict) or \
+                not isinstance(layout.get('fields'), list):
+            return jsonify(msg='layout was not a field layout object'), 400
+
+    # The same image may be used by several fields
+    name_map = defaultdict(list)
+    for k, v in fields.items():
+        if v['value'] is not None:
+            name_map[v['value']].append(k)
 
     pdf = None
     for (name, fname) in save_all_files(tmpdir, request.files):
@@ -79,20 +94,25 @@ def stamp():
             pdf = fname
         elif name == 'fields':
             return jsonify(msg='Fields was not JSON'), 400
+        elif name == 'layout':
+            return jsonify(msg='Layout was not JSON'), 400
         else:
-            fields[name_map[name]]['value'] = fname
+            for field in name_map[name]:
+                fields[field]['value'] = fname
 
     if not pdf:
         return jsonify(msg="No PDF was provided to stamp"), 400
 
     try:
-        writer = sign_and_fill(pdf, outname, fields)
-        pdfdata = BytesIO()
+        writer = sign_and_fill(pdf, fields, layout)
+        pdfdata = spooled_file()
         writer.write(pdfdata)
+        pdfdata.seek(0)
 
-        return Response(
-            pdfdata.getvalue(),
+        return send_file(
+            pdfdata,
             mimetype='application/pdf',
+            conditional=False
         ), 200
 
     except PDFSyntaxError as e:
@@ -0,0 +1,58 @@
+''' PDF manipulation backends.
+
+    Each operation can either be done by spawning pdftk
+    or in-process with PyPDF2 and reportlab. The backend
+    used for an operation is selected with the environment
+    variable PDF_BACKEND_<OPERATION>, e.g.
+    PDF_BACKEND_FILL_FORM=inprocess, falling back to
+    PDF_BACKEND for operations without one.
+
+    pdftk is the default. The in-process backend is
+    opt-in since its results differ: /fields reports
+    the values PyPDF2 finds and filled values are drawn
+    in Helvetica, which can't render non-Latin text.
+'''
+
+import os
+
+from . import pdftk, inprocess
+
+BACKENDS = {
+    'pdftk': pdftk,
+    'inprocess': inprocess
+}
+
+OPERATIONS = ('fill_form', 'dump_fields', 'concat')
+
+DEFAULT_BACKEND = os.environ.get('PDF_BACKEND', 'pdftk')
+
+def get_backend(operation):
+    assert operation in OPERATIONS
+
+    name = os.environ.get(
+        'PDF_BACKEND_' + operation.upper(),
+        DEFAULT_BACKEND
+    )
+    return BACKENDS[name]
+
+def fill_form(pdf, items):
+    ''' Fill the form fields of the PDF at the path pdf with
+        the (name, value) pairs in items and flatten it.
+
+        Returns:
+            The flattened pages as a list of PyPDF2 pages,
+            ready to be stamped and written out.
+    '''
+    return get_backend('fill_form').fill_form(pdf, items)
+
+def dump_fields(pdf):
+    ''' Get a dict mapping the names of the form fields
+        of the PDF at the path pdf to their values.
+    '''
+    return get_backend('dump_fields').dump_fields(pdf)
+
+def concat(inputs, outfile):
+    ''' Concatenate the PDFs at the paths within inputs
+        and write the result to the path outfile.
+    '''
+    get_backend('concat').concat(inputs, outfile)
@@ -0,0 +1,205 @@
+''' In-process implementation of the PDF operations using
+    PyPDF2 and reportlab, this avoids spawning pdftk.
+
+    Flattening removes every form widget from the pages.
+    Widgets of fields that are being filled are replaced
+    by their value drawn as text while all other widgets
+    keep their current appearance.
+'''
+
+from io import BytesIO
+
+import re
+
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.pdf import PageObject
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+)
+
+from reportlab.pdfgen.canvas import Canvas
+
+# Font size used for auto-sized (size 0) text fields
+MAX_FONT_SIZE = 12
+
+# _page_size, _normal_appearance and _place_appearance
+# are copies of those in
+# backend/swagger_server/stamping/local_engine.py
+# since the services are built from separate directories
+# and can't share a module. Keep both copies in sync.
+def _page_size(page):
+    box = page.mediaBox
+    return (float(box.getWidth()), float(box.getHeight()))
+
+def _field_name(annot):
+    ''' Get the fully qualified name of the field that
+        a widget belongs to, as used by pdftk.
+    '''
+
+    parts = []
+    node = annot
+    while node is not None:
+        if '/T' in node:
+            parts.append(str(node['/T']))
+        node = node.get('/Parent')
+        if node is not None:
+            node = node.getObject()
+
+    return '.'.join(reversed(parts))
+
+def _font_size(annot, height):
+    match = re.search(r'([\d.]+)\s+Tf', str(annot.get('/DA', '')))
+    if match and float(match.group(1)) > 0:
+        return float(match.group(1))
+    return min(MAX_FONT_SIZE, height * 0.8)
+
+def _normal_appearance(annot):
+    if '/AP' not in annot:
+        return None
+
+    normal = annot['/AP'].getObject().get('/N')
+    if normal is None:
+        return None
+
+    if isinstance(normal.getObject(), DictionaryObject) and \
+            '/BBox' not in normal.getObject():
+        # Appearance states, e.g. for checkboxes
+        return normal.getObject().get(annot.get('/AS'))
+
+    return normal
+
+def _place_appearance(annot, appearance, name):
+    rect = [float(x) for x in annot['/Rect']]
+    bbox = [float(x) for x in appearance.getObject()['/BBox']]
+
+    bbox_w = (bbox[2] - bbox[0]) or 1
+    bbox_h = (bbox[3] - bbox[1]) or 1
+    sx = (rect[2] - rect[0]) / bbox_w
+    sy = (rect[3] - rect[1]) / bbox_h
+
+    return 'q {} 0 0 {} {} {} cm {} Do Q'.format(
+        sx, sy,
+        rect[0] - bbox[0] * sx,
+        rect[1] - bbox[1] * sy,
+        name
+    )
+
+def _draw_values(page, values):
+    stream = BytesIO()
+    canvas = Canvas(stream, pagesize=_page_size(page))
+
+    for (annot, value) in values:
+        rect = [float(x) for x in annot['/Rect']]
+        height = rect[3] - rect[1]
+        size = _font_size(annot, height)
+
+        canvas.setFont('Helvetica', size)
+        canvas.drawString(
+            rect[0] + 2,
+            rect[1] + (height - size) / 2 + size * 0.2,
+            value
+        )
+
+    canvas.save()
+    return PdfFileReader(stream).getPage(0)
+
+def _flatten_page(page, values):
+    ''' Remove all form widgets from the page, drawing
+        either the value from values or the existing
+        appearance of the widget in its place.
+    '''
+
+    if '/Annots' not in page:
+        return
+
+    kept = ArrayObject()
+    ops = []
+    xobjects = DictionaryObject()
+    filled = []
+
+    for ref in page['/Annots'].getObject():
+        annot = ref.getObject()
+
+        if annot.get('/Subtype') != '/Widget':
+            kept.append(ref)
+            continue
+
+        name = _field_name(annot)
+        if name in values:
+            if values[name]:
+                filled.append((annot, values[name]))
+            continue
+
+        appearance = _normal_appearance(annot)
+        if appearance is None or '/BBox' not in appearance.getObject():
+            continue
+
+        xname = '/Flat{}'.format(len(xobjects))
+        xobjects[NameObject(xname)] = appearance
+        ops.append(_place_appearance(annot, appearance, xname))
+
+    page[NameObject('/Annots')] = kept
+
+    if ops:
+        content = DecodedStreamObject()
+        content.setData('\n'.join(ops).encode('latin-1'))
+
+        overlay = PageObject.createBlankPage(None, *_page_size(page))
+        overlay[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/XObject'): xobjects
+        })
+        overlay[NameObject('/Contents')] = content
+
+        page.mergePage(overlay)
+
+    if filled:
+        page.mergePage(_draw_values(page, filled))
+
+def fill_form(pdf, items):
+    values = {name: str(value or '') for (name, value) in items}
+
+    with open(pdf, 'rb') as file:
+        reader = PdfFileReader(BytesIO(file.read()))
+
+    pages = []
+    for pgnum in range(reader.getNumPages()):
+        page = reader.getPage(pgnum)
+        _flatten_page(page, values)
+        pages.append(page)
+
+    return pages
+
+def _field_value(field):
+    value = field.get('/V')
+    if value is None:
+        return ''
+    if isinstance(value, NameObject):
+        return value[1:]
+    return str(value)
+
+def dump_fields(pdf):
+    with open(pdf, 'rb') as file:
+        fields = PdfFileReader(file).getFields() or {}
+
+    return {
+        name: _field_value(field) for (name, field) in fields.items()
+        # Only terminal fields hold values
+        if not any('/T' in kid.getObject() for kid in field.get('/Kids', []))
+    }
+
+def concat(inputs, outfile):
+    assert outfile
+
+    files = [open(name, 'rb') for name in inputs]
+    try:
+        writer = PdfFileWriter()
+        for file in files:
+            reader = PdfFileReader(file)
+            for pgnum in range(reader.getNumPages()):
+                writer.addPage(reader.getPage(pgnum))
+
+        with open(outfile, 'wb') as output:
+            writer.write(output)
+    finally:
+        for file in files:
+            file.close()
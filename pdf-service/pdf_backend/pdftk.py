@@ -0,0 +1,63 @@
+# pylint: disable=E1101
+
+from io import StringIO, BytesIO
+
+import sh
+
+from fdfgen import forge_fdf
+
+from PyPDF2 import PdfFileReader
+
+def _check_stderr(stderr):
+    stderr = stderr.getvalue()
+    if stderr.strip():
+        raise IOError(stderr)
+
+def _parse_fields(output):
+    out = {}
+    for field in output.split('---'):
+        fields = {}
+        for line in field.split('\n'):
+            if not ':' in line:
+                continue
+            parts = line.split(':', 1)
+            fields[parts[0]] = parts[1]
+        if 'FieldName' in fields:
+            out[fields['FieldName'][1:]] = fields.get('FieldValue', ' ')[1:]
+    return out
+
+def fill_form(pdf, items):
+    stdout = BytesIO()
+    stderr = StringIO()
+    fdf = forge_fdf("", items, [], [], [])
+
+    sh.pdftk(
+        pdf,
+        "fill_form", "-",
+        "output", "-",
+        "dont_ask",
+        "flatten",
+        _in=fdf,
+        _out=stdout,
+        _err=stderr
+    )
+
+    _check_stderr(stderr)
+
+    stdout.seek(0)
+    reader = PdfFileReader(stdout)
+    return [reader.getPage(p) for p in range(reader.getNumPages())]
+
+def dump_fields(pdf):
+    buf = StringIO()
+    sh.pdftk(pdf, 'dump_data_fields_utf8', _out=buf)
+    return _parse_fields(buf.getvalue())
+
+def concat(inputs, outfile):
+    assert outfile
+    sh.pdftk(
+        *inputs,
+        "cat",
+        "output",
+        outfile
+    )
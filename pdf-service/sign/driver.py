@@ -5,39 +5,47 @@ from tempfile import mkstemp
 
 from flask import make_response, abort
 
+from spool import CHUNK_SIZE
+
 from .fill_form import do_fill_form
-from .stamp import fill_signatures, request_fields
+from .stamp import create_attachments, request_fields
 
-def sign_and_fill(pdf, outfile, fields):
+def sign_and_fill(pdf, fields, layout=None):
     """ Fills out the form fields within the pdf
-    then stamps the image fields onto the pdf.
+    then stamps the image fields onto the pdf,
+    in a single pass over the document in memory.
+    The field locations are requested from the
+    field locator unless a layout is provided.
     """
     if not isinstance(fields, dict):
         raise TypeError('Expected dict, found {}'.format(type(fields)))
 
-    with open(pdf, "rb") as pdffile:
-        form_data = request_fields(pdffile)
+    form_data = layout
+    if form_data is None:
+        with open(pdf, "rb") as pdffile:
+            form_data = request_fields(pdffile)
 
-    do_fill_form(pdf, outfile, fields)
+    pages = do_fill_form(pdf, fields)
 
     data = dict((k, v['value']) for k, v in fields.items() if v['type'] == 'image')
-    return fill_signatures(outfile, data, form_data)
+    return create_attachments(pages, data, form_data)
 
 def save_all_files(tgtdir, files):
     for (name, file) in files.items():
         if file.content_type and not (
                 file.content_type == 'application/pdf' or
-                file.content_type == 'image/png'
+                file.content_type == 'image/png' or
+                file.content_type == 'image/jpeg'
             ):
             abort(make_response(
                 "An attached file had a Content-Type " +
-                "other than application/pdf or image/png"
+                "other than application/pdf, image/png or image/jpeg"
             ), 415)
 
         fd, fname = mkstemp(dir=tgtdir)
         os.close(fd)
 
         with open(fname, "wb") as f:
-            file.save(f)
+            file.save(f, CHUNK_SIZE)
 
         yield (name, fname)
@@ -1,9 +1,5 @@
 
-from io import StringIO
-
-import sh
-
-from fdfgen import forge_fdf
+import pdf_backend
 
 class InvalidFieldTypeError(ValueError):
     def __init__(self, field, ty):
@@ -12,25 +8,6 @@ class InvalidFieldTypeError(ValueError):
         self.ty = ty
         self.field = field
 
-def _exec_pdftk(pdf, items, outfile):
-    stderr = StringIO()
-    fdf = forge_fdf("", items, [], [], [])
-
-    # pylint: disable=E1101
-    sh.pdftk(
-        pdf,
-        "fill_form", "-",
-        "output", outfile,
-        "dont_ask",
-        "flatten",
-        _in=fdf,
-        _err=stderr
-    )
-
-    stderr = stderr.getvalue()
-    if stderr.strip():
-        raise IOError(stderr)
-
 def _build_field_desc(fields):
     """Generate a sequence of (string, value) pairs
     suitable for putting into forge_fdf"""
@@ -51,9 +28,11 @@ def _build_field_desc(fields):
         else:
             raise InvalidFieldTypeError(name, field['type'])
 
-def do_fill_form(pdf, outfile, fields):
-    _exec_pdftk(
+def do_fill_form(pdf, fields):
+    """Fill and flatten the form fields of the pdf,
+    returning the resulting pages"""
+
+    return pdf_backend.fill_form(
         pdf,
-        _build_field_desc(fields),
-        outfile
+        list(_build_field_desc(fields))
     )
@@ -1,10 +1,10 @@
+from io import BytesIO
+from collections import defaultdict, OrderedDict
 
-# pylint: disable=E1101
-
-from io import StringIO, BytesIO
-
+import os
 import json
-import sh
+import hashlib
+import threading
 import requests
 
 from reportlab.pdfgen.canvas import Canvas
@@ -16,6 +16,13 @@ from PIL import Image
 
 URL = 'http://field-locator/locate-fields'
 
+# Number of processed images kept in memory
+IMAGE_CACHE_SIZE = int(os.environ.get('IMAGE_CACHE_SIZE', 256))
+JPEG_MAGIC = b'\xff\xd8\xff'
+
+_image_cache = OrderedDict()
+_image_cache_lock = threading.Lock()
+
 class FieldExtractionFailedException(Exception):
     def __init__(self, data, status):
         super().__init__()
@@ -34,86 +41,96 @@ def request_fields(pdf):
     pdf.seek(0)
     return json.loads(r.content)
 
-class Attachement:
-    def __init__(self, data, dimensions):
-        img = Image.open(data)
-        self.img = img
-        self.dimensions = dimensions
-
-        # Discard alpha channel, if it exists
-        if img.mode == "RGBA":
-            self.img = Image.new("RGB", img.size, (255, 255, 255))
-            mask = img.split()[-1]
-            self.img.paste(img, mask=mask)
-
-    def pdf(self):
-        stream = BytesIO()
-
-        pdf = Canvas(stream)
-        pdf.drawImage(ImageReader(self.img), *self.dimensions)
-        pdf.save()
-
-        return PdfFileReader(stream).getPage(0)
-
-
-def exec_pdftk(filename):
-    stdout = BytesIO()
-    stderr = StringIO()
-
-    sh.pdftk(
-        filename,
-        'output', '-',
-        'dont_ask',
-        'flatten',
-        _out=stdout,
-        _err=stderr
-    )
-
-    stderr = stderr.getvalue()
-    if stderr.strip():
-        raise IOError(stderr)
-
-    return stdout
-
-def create_watermarks(fields, data):
-    field_map = {}
+def process_image(data):
+    """ JPEGs are embedded by reportlab without
+    being decoded.
+    Other images are decoded and their alpha channel
+    is discarded.
+    """
+    if data[:3] == JPEG_MAGIC:
+        return data
+
+    img = Image.open(BytesIO(data))
+    img.load()
+
+    # Discard alpha channel, if it exists
+    if img.mode == "RGBA":
+        flat = Image.new("RGB", img.size, (255, 255, 255))
+        flat.paste(img, mask=img.split()[-1])
+        img = flat
+
+    return img
+
+def load_image(filename):
+    """ Load an image to be stamped, the processed image
+    is cached by the hash of its contents since the
+    same signatures are stamped again and again.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    key = hashlib.sha256(data).digest()
+
+    with _image_cache_lock:
+        processed = _image_cache.get(key)
+        if processed is not None:
+            _image_cache.move_to_end(key)
+
+    if processed is None:
+        processed = process_image(data)
+
+        with _image_cache_lock:
+            _image_cache[key] = processed
+            while len(_image_cache) > IMAGE_CACHE_SIZE:
+                _image_cache.popitem(last=False)
+
+    if isinstance(processed, bytes):
+        return ImageReader(BytesIO(processed))
+    return ImageReader(processed)
+
+def create_watermarks(fields, data, pages):
+    """ Draw all images onto one overlay per page, so
+    that every page is only merged once. Images used
+    by several fields are only decoded once.
+    """
+    by_page = defaultdict(list)
     for field in fields['fields']:
-        field_map[field['name']] = field
+        if field['name'] in data:
+            by_page[field['page']].append(field)
 
-    for (key, val) in data.items():
-        if not key in field_map:
-            continue
+    images = {}
+    for (pgnum, page_fields) in by_page.items():
+        box = pages[pgnum].mediaBox
 
-        field = field_map[key]
-
-        dimensions = (
-            field['rect']['x'],
-            field['rect']['y'],
-            field['rect']['w'],
-            field['rect']['h']
+        stream = BytesIO()
+        pdf = Canvas(
+            stream,
+            pagesize=(float(box.getWidth()), float(box.getHeight()))
         )
-        page = field['page']
-        pdf = Attachement(val, dimensions=dimensions).pdf()
 
-        yield (page, pdf)
+        for field in page_fields:
+            filename = data[field['name']]
+            if filename not in images:
+                images[filename] = load_image(filename)
 
+            pdf.drawImage(
+                images[filename],
+                field['rect']['x'],
+                field['rect']['y'],
+                field['rect']['w'],
+                field['rect']['h']
+            )
 
-def create_attachments(pdf, filename, data, fields=None):
-    if not fields:
-        fields = request_fields(pdf)
-    flattened = PdfFileReader(exec_pdftk(filename))
+        pdf.save()
 
-    for pgnum, watermark in create_watermarks(fields, data):
-        page = flattened.getPage(pgnum)
-        page.mergePage(watermark)
+        yield (pgnum, PdfFileReader(stream).getPage(0))
+
+def create_attachments(pages, data, fields):
+    for pgnum, watermark in create_watermarks(fields, data, pages):
+        pages[pgnum].mergePage(watermark)
 
     output = PdfFileWriter()
-    pages = range(flattened.getNumPages())
-    for p in pages:
-        output.addPage(flattened.getPage(p))
+    for page in pages:
+        output.addPage(page)
 
     return output
-
-def fill_signatures(filename, data, fields=None):
-    with open(filename, 'rb') as pdf:
-        return create_attachments(pdf, filename, data, fields)
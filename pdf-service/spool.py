@@ -0,0 +1,25 @@
+import os
+
+from tempfile import SpooledTemporaryFile
+
+from flask import Request
+
+# Uploaded files and generated PDFs larger than this
+# many bytes are spooled to disk instead of memory
+MAX_MEMORY = int(os.environ.get('SPOOL_MAX_MEMORY', 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+def spooled_file():
+    return SpooledTemporaryFile(max_size=MAX_MEMORY, mode='w+b')
+
+class SpoolingRequest(Request):
+    ''' Request class that buffers multipart file parts in
+        spooled temporary files, so that every part uses at
+        most MAX_MEMORY bytes of memory regardless of the
+        size of the request.
+    '''
+
+    # pylint: disable=W0613
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        return spooled_file()